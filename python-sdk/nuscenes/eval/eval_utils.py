@@ -218,7 +218,7 @@ def attr_acc(sample_annotation: Dict, sample_result: Dict, attributes: List[str]
         attr_inds = np.array([i for (i, a) in enumerate(attributes) if a in rel_attributes])
         ann_label = attr_inds[gt_attr_vec[attr_inds] == 1]
         res_label = attr_inds[np.argmax(res_scores[attr_inds])]
-        acc = float(ann_label == res_label)
+        acc = float(ann_label[0] == res_label)
 
     return acc
 
@@ -275,18 +275,24 @@ def boxes_to_sensor(boxes: List[Dict], pose_record: Dict, cs_record: Dict):
     :param cs_record: The calibrated sensor record of the sensor.
     :return: The transformed boxes.
     """
+    # The inverse rotations and translations are the same for all boxes.
+    pose_translation = -np.array(pose_record['translation'])
+    pose_rotation = Quaternion(pose_record['rotation']).inverse
+    cs_translation = -np.array(cs_record['translation'])
+    cs_rotation = Quaternion(cs_record['rotation']).inverse
+
     boxes_out = []
     for box in boxes:
         # Create Box instance.
         box = Box(box['translation'], box['size'], Quaternion(box['rotation']))
 
         # Move box to ego vehicle coord system.
-        box.translate(-np.array(pose_record['translation']))
-        box.rotate(Quaternion(pose_record['rotation']).inverse)
+        box.translate(pose_translation)
+        box.rotate(pose_rotation)
 
         #  Move box to sensor coord system.
-        box.translate(-np.array(cs_record['translation']))
-        box.rotate(Quaternion(cs_record['rotation']).inverse)
+        box.translate(cs_translation)
+        box.rotate(cs_rotation)
 
         boxes_out.append(box)
 
@@ -129,14 +129,11 @@ class NuScenesEval:
         sample_tokens_all = [s['token'] for s in self.nusc.sample]
         assert len(sample_tokens_all) > 0, 'Error: Results file is empty!'
 
-        # Only keep samples from this split.
-        sample_tokens = []
-        for sample_token in sample_tokens_all:
-            scene_token = self.nusc.get('sample', sample_token)['scene_token']
-            log_token = self.nusc.get('scene', scene_token)['log_token']
-            logfile = self.nusc.get('log', log_token)['logfile']
-            if logfile in splits[self.eval_set]:
-                sample_tokens.append(sample_token)
+        # Only keep samples from this split. The split is resolved once per scene rather than once per sample.
+        split_logfiles = set(splits[self.eval_set])
+        split_scene_tokens = {s['token'] for s in self.nusc.scene
+                              if self.nusc.get('log', s['log_token'])['logfile'] in split_logfiles}
+        sample_tokens = [s['token'] for s in self.nusc.sample if s['scene_token'] in split_scene_tokens]
 
         # Limit number of images for debugging.
         if self.eval_limit != -1:
@@ -184,7 +181,9 @@ class NuScenesEval:
             sample_annotations = []
             for sample_annotation_token in sample_annotation_tokens:
                 # Get label name in detection task and filter unused labels.
-                sample_annotation = self.nusc.get('sample_annotation', sample_annotation_token)
+                # The record is copied, as the derived fields below must not be written to the database, whose
+                # records are read-only with table_backend='array'.
+                sample_annotation = dict(self.nusc.get('sample_annotation', sample_annotation_token))
                 detection_name = category_to_detection_name(sample_annotation['category_name'])
                 if detection_name is None:
                     continue
@@ -284,7 +283,7 @@ class NuScenesEval:
             'weighted_sum': weighted_sum,
             'eval_time': eval_time
         }
-        with open(os.path.join(output_dir, 'metrics.json'), 'w') as f:
+        with open(os.path.join(self.output_dir, 'metrics.json'), 'w') as f:
             json.dump(all_metrics, f, indent=2)
 
         return all_metrics
@@ -389,7 +388,7 @@ class NuScenesEval:
 
         # Accumulate.
         tp, fp = np.cumsum(tp), np.cumsum(fp)
-        tp, fp = tp.astype(np.float), fp.astype(np.float)
+        tp, fp = tp.astype(np.float64), fp.astype(np.float64)
 
         # Calculate precision and recall.
         prec = tp / (fp + tp)
@@ -3,29 +3,217 @@
 # Licensed under the Creative Commons [see licence.txt]
 
 """
-Export fused point clouds of a scene to a Wavefront OBJ file.
+Export fused point clouds of a scene to a Wavefront OBJ file, a binary PLY file or NumPy .npy/.npz files.
 This point-cloud can be viewed in your favorite 3D rendering tool, e.g. Meshlab or Maya.
 """
 import os
 import os.path as osp
 import argparse
-from typing import Tuple
+import zipfile
+from typing import Tuple, List
 
 import numpy as np
-from PIL import Image
-from pyquaternion import Quaternion
 from tqdm import tqdm
 
-from nuscenes.utils.data_classes import LidarPointCloud
-from nuscenes.utils.geometry_utils import view_points
+from nuscenes.utils.data_classes import PointCloud, LidarPointCloud
 from nuscenes.nuscenes import NuScenes
 
 
+# Layout of an exported point, in the global frame with RGB colors. This is also the vertex layout of PLY files.
+VERTEX_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+
+# Layout of a point written to an OBJ file, which is text and therefore keeps the coordinates in double precision.
+OBJ_VERTEX_DTYPE = np.dtype([('x', '<f8'), ('y', '<f8'), ('z', '<f8'), ('red', 'u1'), ('green', 'u1'),
+                             ('blue', 'u1')])
+
+
+class ObjWriter:
+    """ Writes points to a Wavefront OBJ file with one line per point. """
+
+    vertex_dtype = OBJ_VERTEX_DTYPE
+
+    def __init__(self, out_path: str):
+        self.file = open(out_path, 'w')
+        self.file.write("OBJ File:\n")
+
+    def write(self, vertices: np.ndarray, sample_data_token: str) -> None:
+        """
+        Appends points to the file.
+        :param vertices: <OBJ_VERTEX_DTYPE: n> or <VERTEX_DTYPE: n>. The points.
+        :param sample_data_token: The sweep of the points.
+        """
+        rows = np.empty((len(vertices), 6))
+        for i, name in enumerate(OBJ_VERTEX_DTYPE.names):
+            rows[:, i] = vertices[name] if i < 3 else vertices[name] / 255.0
+        np.savetxt(self.file, rows, fmt='v %.8f %.8f %.8f %.4f %.4f %.4f')
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class PlyWriter:
+    """
+    Writes points to a binary little endian PLY file. The number of points in the header is zero-padded to a fixed
+    width, so that it can be filled in after streaming all points to the file.
+    """
+
+    HEADER = 'ply\nformat binary_little_endian 1.0\nelement vertex {:015d}\nproperty float x\nproperty float y\n' \
+             'property float z\nproperty uchar red\nproperty uchar green\nproperty uchar blue\nend_header\n'
+
+    vertex_dtype = VERTEX_DTYPE
+
+    def __init__(self, out_path: str):
+        self.file = open(out_path, 'wb')
+        self.file.write(self.HEADER.format(0).encode('ascii'))
+        self.nbr_points = 0
+
+    def write(self, vertices: np.ndarray, sample_data_token: str) -> None:
+        """
+        Appends points to the file.
+        :param vertices: <VERTEX_DTYPE: n>. The points.
+        :param sample_data_token: The sweep of the points.
+        """
+        self.file.write(vertices.tobytes())
+        self.nbr_points += len(vertices)
+
+    def close(self) -> None:
+        self.file.seek(0)
+        self.file.write(self.HEADER.format(self.nbr_points).encode('ascii'))
+        self.file.close()
+
+
+class NpyWriter:
+    """
+    Writes points to a .npy file with a one-dimensional VERTEX_DTYPE array. The header is padded to a fixed size, so
+    that the shape can be filled in after streaming all points to the file.
+    """
+
+    HEADER_SIZE = 256
+
+    vertex_dtype = VERTEX_DTYPE
+
+    def __init__(self, out_path: str):
+        self.file = open(out_path, 'wb')
+        self.file.write(self._header(0))
+        self.nbr_points = 0
+
+    def write(self, vertices: np.ndarray, sample_data_token: str) -> None:
+        """
+        Appends points to the file.
+        :param vertices: <VERTEX_DTYPE: n>. The points.
+        :param sample_data_token: The sweep of the points.
+        """
+        self.file.write(vertices.tobytes())
+        self.nbr_points += len(vertices)
+
+    def close(self) -> None:
+        self.file.seek(0)
+        self.file.write(self._header(self.nbr_points))
+        self.file.close()
+
+    def _header(self, nbr_points: int) -> bytes:
+        """
+        Creates a version 1.0 .npy header.
+        :param nbr_points: Number of points in the file.
+        :return: The header of HEADER_SIZE bytes.
+        """
+        header = "{{'descr': {}, 'fortran_order': False, 'shape': ({},), }}".format(
+            np.lib.format.dtype_to_descr(VERTEX_DTYPE), nbr_points)
+        header = header.ljust(self.HEADER_SIZE - 11) + '\n'
+        assert len(header) == self.HEADER_SIZE - 10, 'Error: .npy header too long!'
+        return np.lib.format.magic(1, 0) + np.uint16(len(header)).tobytes() + header.encode('latin1')
+
+
+class NpzWriter:
+    """
+    Writes points to a compressed .npz file with one VERTEX_DTYPE array per sweep, named by its sample_data token.
+    """
+
+    vertex_dtype = VERTEX_DTYPE
+
+    def __init__(self, out_path: str):
+        self.file = zipfile.ZipFile(out_path, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    def write(self, vertices: np.ndarray, sample_data_token: str) -> None:
+        """
+        Adds the points of a sweep to the file.
+        :param vertices: <VERTEX_DTYPE: n>. The points.
+        :param sample_data_token: The sweep of the points.
+        """
+        with self.file.open(sample_data_token + '.npy', mode='w', force_zip64=True) as f:
+            np.lib.format.write_array(f, vertices, allow_pickle=False)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+# Writer class by output format. Each writer takes points of its vertex_dtype.
+POINTCLOUD_WRITERS = {'obj': ObjWriter, 'ply': PlyWriter, 'npy': NpyWriter, 'npz': NpzWriter}
+
+
+class VoxelSet:
+    """
+    Set of occupied voxels of a regular grid in the global frame, used to drop points in voxels that are already
+    occupied by earlier points. The voxel keys are kept in a sorted array and a few smaller sorted arrays that are
+    merged into it from time to time, so that adding the points of a sweep does not re-sort all keys.
+    """
+
+    # Number of bits per voxel coordinate in a key.
+    BITS = 21
+
+    def __init__(self, voxel_size: float):
+        """
+        :param voxel_size: Edge length of the voxels.
+        """
+        if not voxel_size > 0:
+            raise ValueError('Invalid voxel size: {}'.format(voxel_size))
+        self.voxel_size = voxel_size
+        self.levels = []
+
+    def add(self, points: np.ndarray) -> np.ndarray:
+        """
+        Adds points to the set.
+        :param points: <np.float: 3, n>. Points in the global frame.
+        :return: <np.bool: n>. Mask of the points that are the first in their voxel, including earlier calls.
+        """
+        coords = np.floor(points[:3, :] / self.voxel_size).astype(np.int64) + 2 ** (self.BITS - 1)
+        if not np.all((coords >= 0) & (coords < 2 ** self.BITS)):
+            raise ValueError('Points out of range for voxel size {}'.format(self.voxel_size))
+        keys = (coords[0] << (2 * self.BITS)) | (coords[1] << self.BITS) | coords[2]
+
+        # Keep the first point of each new voxel.
+        new_keys, first = np.unique(keys, return_index=True)
+        is_new = np.ones(len(new_keys), dtype=bool)
+        for level in self.levels:
+            pos = np.minimum(np.searchsorted(level, new_keys), len(level) - 1)
+            is_new &= level[pos] != new_keys
+        new_keys, first = new_keys[is_new], first[is_new]
+
+        # Merge levels of similar size, as in a binary counter, to keep the number of levels logarithmic.
+        if len(new_keys) > 0:
+            self.levels.append(new_keys)
+        while len(self.levels) > 1 and len(self.levels[-2]) <= 2 * len(self.levels[-1]):
+            merged = np.concatenate(self.levels[-2:])
+            merged.sort()
+            self.levels[-2:] = [merged]
+
+        mask = np.zeros(len(keys), dtype=bool)
+        mask[first] = True
+        return mask
+
+    def __len__(self) -> int:
+        return sum(len(level) for level in self.levels)
+
+
 def export_scene_pointcloud(nusc: NuScenes, out_path: str, scene_token: str, channel: str='LIDAR_TOP',
-                            min_dist: float=3.0, max_dist: float=30.0, verbose: bool=True) -> None:
+                            min_dist: float=3.0, max_dist: float=30.0, verbose: bool=True,
+                            resolve: str='last', out_format: str=None, voxel_size: float=None) -> None:
     """
-    Export fused point clouds of a scene to a Wavefront OBJ file.
+    Export fused point clouds of a scene to a Wavefront OBJ file, a binary PLY file or NumPy .npy/.npz files.
     This point-cloud can be viewed in your favorite 3D rendering tool, e.g. Meshlab or Maya.
+    The points are written sweep by sweep, so that the memory use does not grow with the length of the scene.
+    They are transformed to the global frame in double precision. OBJ files keep the coordinates in double precision,
+    the binary formats store them as float32 (see VERTEX_DTYPE).
     :param nusc: NuScenes instance.
     :param out_path: Output path to write the point-cloud to.
     :param scene_token: Unique identifier of scene to render.
@@ -33,6 +221,10 @@ def export_scene_pointcloud(nusc: NuScenes, out_path: str, scene_token: str, cha
     :param min_dist: Minimum distance to ego vehicle below which points are dropped.
     :param max_dist: Maximum distance to ego vehicle above which points are dropped.
     :param verbose: Whether to print messages to stdout.
+    :param resolve: Which camera colors points that are seen by several cameras (see pointcloud_color_from_cameras()).
+    :param out_format: One of 'obj', 'ply', 'npy' (a single array of VERTEX_DTYPE points) and 'npz' (one array per
+        sweep). Inferred from the extension of out_path if None.
+    :param voxel_size: If set, only the first point in each voxel of this size in the global frame is written.
     """
 
     # Check inputs.
@@ -40,44 +232,41 @@ def export_scene_pointcloud(nusc: NuScenes, out_path: str, scene_token: str, cha
                       'RADAR_BACK_RIGHT']
     camera_channels = ['CAM_FRONT_LEFT', 'CAM_FRONT', 'CAM_FRONT_RIGHT', 'CAM_BACK_LEFT', 'CAM_BACK', 'CAM_BACK_RIGHT']
     assert channel in valid_channels, 'Input channel {} not valid.'.format(channel)
+    if out_format is None:
+        out_format = osp.splitext(out_path)[1][1:].lower()
+    if out_format not in POINTCLOUD_WRITERS:
+        raise ValueError('Invalid output format: {}'.format(out_format))
+    voxel_set = None if voxel_size is None else VoxelSet(voxel_size)
 
     # Get records from DB.
     scene_rec = nusc.get('scene', scene_token)
     start_sample_rec = nusc.get('sample', scene_rec['first_sample_token'])
-    sd_rec = nusc.get('sample_data', start_sample_rec['data'][channel])
 
-    # Make list of frames
-    cur_sd_rec = sd_rec
-    sd_tokens = []
-    while cur_sd_rec['next'] != '':
-        cur_sd_rec = nusc.get('sample_data', cur_sd_rec['next'])
-        sd_tokens.append(cur_sd_rec['token'])
+    # Make list of frames. Each frame is colored using the cameras of the sample of the following sample_data.
+    sd_tokens = nusc.get_sample_data_from(start_sample_rec['data'][channel])
 
     # Write point-cloud.
-    with open(out_path, 'w') as f:
-        f.write("OBJ File:\n")
-
-        for sd_token in tqdm(sd_tokens):
+    writer = POINTCLOUD_WRITERS[out_format](out_path)
+    try:
+        for lidar_token, sd_token in tqdm(list(zip(sd_tokens[:-1], sd_tokens[1:]))):
+            lidar_rec = nusc.get('sample_data', lidar_token)
             if verbose:
-                print('Processing {}'.format(sd_rec['filename']))
+                print('Processing {}'.format(lidar_rec['filename']))
             sc_rec = nusc.get('sample_data', sd_token)
             sample_rec = nusc.get('sample', sc_rec['sample_token'])
-            lidar_token = sd_rec['token']
-            lidar_rec = nusc.get('sample_data', lidar_token)
             pc = LidarPointCloud.from_file(osp.join(nusc.dataroot, lidar_rec['filename']))
 
-            # Get point cloud colors.
-            coloring = np.ones((3, pc.points.shape[1])) * -1
-            for channel in camera_channels:
-                camera_token = sample_rec['data'][channel]
-                cam_coloring, cam_mask = pointcloud_color_from_image(nusc, lidar_token, camera_token)
-                coloring[:, cam_mask] = cam_coloring
+            # Get point cloud colors from all cameras at once.
+            camera_tokens = [sample_rec['data'][camera_channel] for camera_channel in camera_channels]
+            coloring, _ = pointcloud_color_from_cameras(nusc, lidar_token, camera_tokens, pc=pc, resolve=resolve)
+
+            # Transform the points in double precision, as float32 coordinates are only accurate to about 0.1mm at 1km
+            # from the origin of the global frame.
+            pc.points = pc.points.astype(np.float64)
 
             # Points live in their own reference frame. So they need to be transformed via global to the image plane.
             # First step: transform the point cloud to the ego vehicle frame for the timestamp of the sweep.
-            cs_record = nusc.get('calibrated_sensor', lidar_rec['calibrated_sensor_token'])
-            pc.rotate(Quaternion(cs_record['rotation']).rotation_matrix)
-            pc.translate(np.array(cs_record['translation']))
+            pc.transform(nusc.transform('calibrated_sensor', lidar_rec['calibrated_sensor_token']))
 
             # Optional Filter by distance to remove the ego vehicle.
             dists_origin = np.sqrt(np.sum(pc.points[:3, :] ** 2, axis=0))
@@ -88,21 +277,20 @@ def export_scene_pointcloud(nusc: NuScenes, out_path: str, scene_token: str, cha
                 print('Distance filter: Keeping %d of %d points...' % (keep.sum(), len(keep)))
 
             # Second step: transform to the global frame.
-            poserecord = nusc.get('ego_pose', lidar_rec['ego_pose_token'])
-            pc.rotate(Quaternion(poserecord['rotation']).rotation_matrix)
-            pc.translate(np.array(poserecord['translation']))
+            pc.transform(nusc.transform('ego_pose', lidar_rec['ego_pose_token']))
 
-            # Write points to file
-            for (v, c) in zip(pc.points.transpose(), coloring.transpose()):
-                if (c == -1).any():
-                    # Ignore points without a color.
-                    pass
-                else:
-                    f.write("v {v[0]:.8f} {v[1]:.8f} {v[2]:.8f} {c[0]:.4f} {c[1]:.4f} {c[2]:.4f}\n"
-                            .format(v=v, c=c/255.0))
+            # Ignore points without a color and optionally points in voxels that are already occupied.
+            keep = np.all(coloring != -1, axis=0)
+            if voxel_set is not None:
+                keep[keep] = voxel_set.add(pc.points[:3, keep])
 
-            if not sd_rec['next'] == "":
-                sd_rec = nusc.get('sample_data', sd_rec['next'])
+            # Write points to file
+            vertices = np.empty(np.count_nonzero(keep), dtype=writer.vertex_dtype)
+            for i, name in enumerate(writer.vertex_dtype.names):
+                vertices[name] = pc.points[i, keep] if i < 3 else coloring[i - 3, keep]
+            writer.write(vertices, lidar_token)
+    finally:
+        writer.close()
 
 
 def pointcloud_color_from_image(nusc: NuScenes, pointsensor_token: str, camera_token: str) -> Tuple[np.array, np.array]:
@@ -116,59 +304,63 @@ def pointcloud_color_from_image(nusc: NuScenes, pointsensor_token: str, camera_t
         image out of m total points. The mask indicates which points are selected.
     """
 
-    cam = nusc.get('sample_data', camera_token)
-    pointsensor = nusc.get('sample_data', pointsensor_token)
-
-    pc = LidarPointCloud.from_file(osp.join(nusc.dataroot, pointsensor['filename']))
-    im = Image.open(osp.join(nusc.dataroot, cam['filename']))
-
-    # Points live in the point sensor frame. So they need to be transformed via global to the image plane.
-    # First step: transform the point-cloud to the ego vehicle frame for the timestamp of the sweep.
-    cs_record = nusc.get('calibrated_sensor', pointsensor['calibrated_sensor_token'])
-    pc.rotate(Quaternion(cs_record['rotation']).rotation_matrix)
-    pc.translate(np.array(cs_record['translation']))
-
-    # Second step: transform to the global frame.
-    poserecord = nusc.get('ego_pose', pointsensor['ego_pose_token'])
-    pc.rotate(Quaternion(poserecord['rotation']).rotation_matrix)
-    pc.translate(np.array(poserecord['translation']))
-
-    # Third step: transform into the ego vehicle frame for the timestamp of the image.
-    poserecord = nusc.get('ego_pose', cam['ego_pose_token'])
-    pc.translate(-np.array(poserecord['translation']))
-    pc.rotate(Quaternion(poserecord['rotation']).rotation_matrix.T)
-
-    # Fourth step: transform into the camera.
-    cs_record = nusc.get('calibrated_sensor', cam['calibrated_sensor_token'])
-    pc.translate(-np.array(cs_record['translation']))
-    pc.rotate(Quaternion(cs_record['rotation']).rotation_matrix.T)
-
-    # Fifth step: actually take a "picture" of the point cloud.
-    # Grab the depths (camera frame z axis points away from the camera).
-    depths = pc.points[2, :]
-
-    # Take the actual picture (matrix multiplication with camera-matrix + renormalization).
-    points = view_points(pc.points[:3, :], np.array(cs_record['camera_intrinsic']), normalize=True)
-
-    # Remove points that are either outside or behind the camera. Leave a margin of 1 pixel for aesthetic reasons.
-    mask = np.ones(depths.shape[0], dtype=bool)
-    mask = np.logical_and(mask, depths > 0)
-    mask = np.logical_and(mask, points[0, :] > 1)
-    mask = np.logical_and(mask, points[0, :] < im.size[0] - 1)
-    mask = np.logical_and(mask, points[1, :] > 1)
-    mask = np.logical_and(mask, points[1, :] < im.size[1] - 1)
-    points = points[:, mask]
-
-    # Pick the colors of the points
-    im_data = np.array(im)
-    coloring = np.zeros(points.shape)
-    for i, p in enumerate(points.transpose()):
-        point = p[:2].round().astype(np.int32)
-        coloring[:, i] = im_data[point[1], point[0], :]
+    # Project the points into the image, see NuScenes.project_pointcloud().
+    points, _, masks, images = nusc.project_pointcloud(pointsensor_token, [camera_token], load_images=True)
+    mask = masks[0]
+
+    # Pick the colors of the points.
+    pixels = np.round(points[0][:, mask]).astype(np.int32)
+    coloring = np.array(images[0])[pixels[1], pixels[0], :].T.astype(np.float64)
 
     return coloring, mask
 
 
+def pointcloud_color_from_cameras(nusc: NuScenes, pointsensor_token: str, camera_tokens: List[str],
+                                  pc: PointCloud=None, resolve: str='last') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Colors a point cloud with several cameras at once, e.g. all cameras of a sample. Points that are seen by several
+    cameras are colored by one of them, depending on resolve:
+    - 'last': The last camera in camera_tokens, as when coloring the cameras one after another. This is the default.
+    - 'nearest': The camera closest to the point along its viewing direction (the smallest depth).
+    - 'resolution': The camera that sees the point at the highest resolution, i.e. with the most pixels per meter
+        (focal length / depth).
+    :param nusc: NuScenes instance.
+    :param pointsensor_token: Lidar/radar sample_data token.
+    :param camera_tokens: Camera sample_data tokens.
+    :param pc: The point cloud in the point sensor frame. Loaded from the pointsensor file if None.
+    :param resolve: How to choose between cameras, see above.
+    :return (coloring <np.float: 3, n>, camera_ids <np.int: n>). The colors of all n points and the index in
+        camera_tokens of the camera that colored each point. Both are -1 for points that are not seen by any camera.
+    """
+    if resolve not in ('nearest', 'resolution', 'last'):
+        raise ValueError('Invalid resolve mode: {}'.format(resolve))
+
+    points, depths, masks, images = nusc.project_pointcloud(pointsensor_token, camera_tokens, pc=pc, load_images=True)
+
+    # Score the cameras for each point and let the best camera that sees the point color it.
+    if resolve == 'nearest':
+        scores = -depths
+    elif resolve == 'resolution':
+        focal_lengths = [nusc.get('calibrated_sensor', nusc.get('sample_data', camera_token)['calibrated_sensor_token'])
+                         ['camera_intrinsic'][0][0] for camera_token in camera_tokens]
+        with np.errstate(divide='ignore'):
+            scores = np.array(focal_lengths).reshape(-1, 1) / depths
+    else:
+        scores = np.broadcast_to(np.arange(len(camera_tokens)).reshape(-1, 1), masks.shape)
+    scores = np.where(masks, scores, -np.inf)
+    camera_ids = np.argmax(scores, axis=0) if len(camera_tokens) > 0 else np.zeros(masks.shape[1], dtype=np.int64)
+    camera_ids[~np.any(masks, axis=0)] = -1
+
+    # Pick the colors of the points from their camera.
+    coloring = -np.ones((3, masks.shape[1]))
+    for i, im in enumerate(images):
+        selected = camera_ids == i
+        pixels = np.round(points[i][:, selected]).astype(np.int32)
+        coloring[:, selected] = np.array(im)[pixels[1], pixels[0], :].T
+
+    return coloring, camera_ids
+
+
 if __name__ == '__main__':
     # Read input parameters
     parser = argparse.ArgumentParser(description='Export a scene in Wavefront point cloud format.',
@@ -176,12 +368,17 @@ if __name__ == '__main__':
     parser.add_argument('--scene', default='scene-0061', type=str, help='Name of a scene, e.g. scene-0061')
     parser.add_argument('--out_dir', default='~/nuscenes-visualization/pointclouds', type=str, help='Output folder')
     parser.add_argument('--verbose', default=0, type=int, help='Whether to print outputs to stdout')
+    parser.add_argument('--format', default='obj', type=str, choices=sorted(POINTCLOUD_WRITERS.keys()),
+                        help='Output format')
+    parser.add_argument('--voxel_size', default=0, type=float,
+                        help='Keep only the first point per voxel of this size in meters, 0 keeps all points')
     args = parser.parse_args()
     out_dir = os.path.expanduser(args.out_dir)
     scene_name = args.scene
     verbose = bool(args.verbose)
+    voxel_size = args.voxel_size if args.voxel_size > 0 else None
 
-    out_path = osp.join(out_dir, '%s.obj' % scene_name)
+    out_path = osp.join(out_dir, '%s.%s' % (scene_name, args.format))
     if osp.exists(out_path):
         print('=> File {} already exists. Aborting.'.format(out_path))
         exit()
@@ -197,4 +394,5 @@ if __name__ == '__main__':
     scene_tokens = [s['token'] for s in nusc.scene if s['name'] == scene_name]
     assert len(scene_tokens) == 1, 'Error: Invalid scene %s' % scene_name
 
-    export_scene_pointcloud(nusc, out_path, scene_tokens[0], channel='LIDAR_TOP', verbose=verbose)
+    export_scene_pointcloud(nusc, out_path, scene_tokens[0], channel='LIDAR_TOP', verbose=verbose,
+                            out_format=args.format, voxel_size=voxel_size)
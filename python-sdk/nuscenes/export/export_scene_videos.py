@@ -4,24 +4,130 @@
 
 """
 Exports a video of each scene (with annotations) to disk.
+The scenes are rendered headless and in parallel by a pool of worker processes that share the loaded database.
 """
 import os
+import os.path as osp
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Tuple
+
+import cv2
+from tqdm import tqdm
 
 from nuscenes.nuscenes import NuScenes
 
-# Load NuScenes class
-nusc = NuScenes()
-scene_tokens = [s['token'] for s in nusc.scene]
-
-# Create output directory
-out_dir = os.path.expanduser('~/nuscenes-visualization/scene-videos')
-if not os.path.isdir(out_dir):
-    os.makedirs(out_dir)
-
-# Write videos to disk
-for scene_token in scene_tokens:
-    scene = nusc.get('scene', scene_token)
-    print('Writing scene %s' % scene['name'])
-    out_path = os.path.join(out_dir, scene['name']) + '.avi'
-    if not os.path.exists(out_path):
-        nusc.render_scene(scene['token'], out_path=out_path)
+# The database of a worker process, see _init_worker().
+_nusc = None
+
+
+def _init_worker(nusc_or_handle, limit_threads: bool=True) -> None:
+    """
+    Makes the database available to a worker process.
+    :param nusc_or_handle: A NuScenes instance, which forked workers inherit and spawned workers unpickle, or a shared
+        memory handle (see NuScenes.share_memory()).
+    :param limit_threads: Whether to limit OpenCV to one thread. This is a process-wide setting, so it is only
+        changed in worker processes.
+    """
+    global _nusc
+    if isinstance(nusc_or_handle, dict):
+        _nusc = NuScenes.attach_shared_memory(nusc_or_handle)
+    else:
+        _nusc = nusc_or_handle
+
+    # Scenes are rendered in parallel already, so OpenCV should not start more threads.
+    if limit_threads:
+        cv2.setNumThreads(1)
+
+
+def _export_scene(scene_token: str, out_path: str, freq: float, imsize: Tuple[int, int]) -> Tuple[str, float]:
+    """
+    Renders the video of one scene. It is written to a temporary file first, so that an interrupted export is not
+    mistaken for a finished one.
+    :param scene_token: Unique identifier of the scene.
+    :param out_path: Path of the video file.
+    :param freq: Frame rate of the video (Hz).
+    :param imsize: Size of each camera image in the video.
+    :return: (scene_token, seconds). The scene and the time it took to render it.
+    """
+    start_time = time.time()
+    root, ext = osp.splitext(out_path)
+    partial_path = root + '.partial' + ext
+    _nusc.render_scene(scene_token, freq=freq, imsize=imsize, out_path=partial_path, headless=True)
+    os.replace(partial_path, out_path)
+    return scene_token, time.time() - start_time
+
+
+def export_scene_videos(nusc: NuScenes, out_dir: str, scene_tokens: List[str]=None, num_workers: int=None,
+                        freq: float=10, imsize: Tuple[int, int]=(640, 360), verbose: bool=True) -> None:
+    """
+    Exports a video of each scene to out_dir, named by the scene name. Scenes with an existing video are skipped.
+    :param nusc: NuScenes instance.
+    :param out_dir: Output folder.
+    :param scene_tokens: The scenes to export. All scenes if None.
+    :param num_workers: Number of worker processes. Defaults to the number of CPUs. 1 renders in this process.
+    :param freq: Frame rate of the videos (Hz).
+    :param imsize: Size of each camera image in the videos.
+    :param verbose: Whether to print the time of each scene.
+    """
+    if scene_tokens is None:
+        scene_tokens = [s['token'] for s in nusc.scene]
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    if not osp.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    # Skip the scenes that are already exported.
+    jobs = []
+    for scene_token in scene_tokens:
+        out_path = osp.join(out_dir, nusc.get('scene', scene_token)['name'] + '.avi')
+        if not osp.exists(out_path):
+            jobs.append((scene_token, out_path))
+    print('Exporting %d scenes, skipping %d existing videos.' % (len(jobs), len(scene_tokens) - len(jobs)))
+    if len(jobs) == 0:
+        return
+
+    start_time = time.time()
+    num_workers = min(num_workers, len(jobs))
+    if num_workers == 1:
+        _init_worker(nusc, limit_threads=False)
+        results = (_export_scene(scene_token, out_path, freq, imsize) for scene_token, out_path in jobs)
+        for scene_token, seconds in tqdm(results, total=len(jobs)):
+            if verbose:
+                tqdm.write('Wrote scene %s in %.1fs' % (nusc.get('scene', scene_token)['name'], seconds))
+    else:
+        # Share the tables through shared memory if possible. Otherwise forked workers inherit the instance and
+        # spawned workers unpickle it once each.
+        handle = nusc.share_memory() if nusc.table_backend == 'array' and nusc.compact_tokens else None
+        try:
+            with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                                     initargs=(nusc if handle is None else handle,)) as executor:
+                futures = [executor.submit(_export_scene, scene_token, out_path, freq, imsize)
+                           for scene_token, out_path in jobs]
+                for future in tqdm(as_completed(futures), total=len(futures)):
+                    scene_token, seconds = future.result()
+                    if verbose:
+                        tqdm.write('Wrote scene %s in %.1fs' % (nusc.get('scene', scene_token)['name'], seconds))
+        finally:
+            if handle is not None:
+                nusc.release_shared_memory()
+
+    print('Exported %d scenes in %.1fs with %d workers.' % (len(jobs), time.time() - start_time, num_workers))
+
+
+if __name__ == '__main__':
+    # Read input parameters
+    parser = argparse.ArgumentParser(description='Export a video of each scene.',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--out_dir', default='~/nuscenes-visualization/scene-videos', type=str, help='Output folder')
+    parser.add_argument('--version', default='v0.1', type=str, help='Version of the database')
+    parser.add_argument('--dataroot', default='/data/nuscenes', type=str, help='Path to the database')
+    parser.add_argument('--num_workers', default=os.cpu_count(), type=int, help='Number of worker processes')
+    args = parser.parse_args()
+
+    # Load NuScenes class
+    nusc = NuScenes(version=args.version, dataroot=args.dataroot)
+
+    # Write videos to disk
+    export_scene_videos(nusc, os.path.expanduser(args.out_dir), num_workers=args.num_workers)
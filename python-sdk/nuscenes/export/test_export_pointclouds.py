@@ -0,0 +1,137 @@
+# nuScenes dev-kit.
+# Licensed under the Creative Commons [see licence.txt]
+
+import os.path as osp
+import tempfile
+import unittest
+
+import numpy as np
+
+from nuscenes.export.export_pointclouds_as_obj import VERTEX_DTYPE, OBJ_VERTEX_DTYPE, POINTCLOUD_WRITERS, ObjWriter, \
+    VoxelSet
+
+
+def make_vertices(n: int, seed: int) -> np.ndarray:
+    """ Returns n random points with colors. """
+    rng = np.random.RandomState(seed)
+    vertices = np.empty(n, dtype=VERTEX_DTYPE)
+    for name in ['x', 'y', 'z']:
+        vertices[name] = rng.randn(n) * 50
+    for name in ['red', 'green', 'blue']:
+        vertices[name] = rng.randint(0, 256, n)
+    return vertices
+
+
+class TestPointCloudWriters(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.chunks = [make_vertices(100, 0), make_vertices(0, 1), make_vertices(37, 2)]
+        self.tokens = ['sweep-%d' % i for i in range(len(self.chunks))]
+        self.vertices = np.concatenate(self.chunks)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, out_format: str) -> str:
+        """ Writes all chunks in a format and returns the path of the file. """
+        out_path = osp.join(self.tmp_dir.name, 'points.' + out_format)
+        writer = POINTCLOUD_WRITERS[out_format](out_path)
+        for chunk, token in zip(self.chunks, self.tokens):
+            writer.write(chunk, token)
+        writer.close()
+        return out_path
+
+    def test_npy(self):
+        """Test that a streamed .npy file is read back by np.load()."""
+        vertices = np.load(self.write('npy'))
+        self.assertEqual(vertices.dtype, VERTEX_DTYPE)
+        np.testing.assert_array_equal(vertices, self.vertices)
+
+    def test_npz(self):
+        """Test that every sweep of a .npz file is read back by np.load()."""
+        with np.load(self.write('npz')) as npz:
+            self.assertEqual(sorted(npz.files), sorted(self.tokens))
+            for chunk, token in zip(self.chunks, self.tokens):
+                self.assertEqual(npz[token].dtype, VERTEX_DTYPE)
+                np.testing.assert_array_equal(npz[token], chunk)
+
+    def test_ply(self):
+        """Test that a streamed PLY file has a valid header and all points."""
+        with open(self.write('ply'), 'rb') as f:
+            data = f.read()
+        header, body = data.split(b'end_header\n', 1)
+        lines = header.decode('ascii').splitlines()
+        self.assertEqual(lines[:2], ['ply', 'format binary_little_endian 1.0'])
+        self.assertEqual(lines[2].split()[:2], ['element', 'vertex'])
+        self.assertEqual(int(lines[2].split()[2]), len(self.vertices))
+        self.assertEqual([line.split()[1:] for line in lines[3:]],
+                         [['float', 'x'], ['float', 'y'], ['float', 'z'],
+                          ['uchar', 'red'], ['uchar', 'green'], ['uchar', 'blue']])
+        np.testing.assert_array_equal(np.frombuffer(body, dtype=VERTEX_DTYPE), self.vertices)
+
+    def test_obj(self):
+        """Test that an OBJ file has one vertex line per point."""
+        with open(self.write('obj')) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'OBJ File:')
+        rows = np.array([[float(v) for v in line.split()[1:]] for line in lines[1:]])
+        self.assertEqual(rows.shape, (len(self.vertices), 6))
+        for i, name in enumerate(VERTEX_DTYPE.names):
+            expected = self.vertices[name] if i < 3 else self.vertices[name] / 255.0
+            np.testing.assert_allclose(rows[:, i], expected, atol=1e-4)
+
+    def test_obj_precision(self):
+        """Test that an OBJ file keeps the coordinates of OBJ_VERTEX_DTYPE points in double precision."""
+        self.assertIs(ObjWriter.vertex_dtype, OBJ_VERTEX_DTYPE)
+        vertices = np.zeros(2, dtype=OBJ_VERTEX_DTYPE)
+        vertices['x'] = [1187.12345678, -411.00000001]
+        out_path = osp.join(self.tmp_dir.name, 'points.obj')
+        writer = ObjWriter(out_path)
+        writer.write(vertices, 'sweep')
+        writer.close()
+        with open(out_path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual([line.split()[1] for line in lines[1:]], ['1187.12345678', '-411.00000001'])
+
+
+class TestVoxelSet(unittest.TestCase):
+    def test_dedup(self):
+        """Test that only the first point of each voxel is kept, across calls."""
+        voxels = VoxelSet(0.5)
+        points = np.array([[0.1, 0.2, 0.6, -0.1], [0, 0.3, 0, 0], [0, 0, 0, 0]])
+        np.testing.assert_array_equal(voxels.add(points), [True, False, True, True])
+        np.testing.assert_array_equal(voxels.add(points), [False, False, False, False])
+        self.assertEqual(len(voxels), 3)
+
+        mask = voxels.add(np.array([[0.4, 5.0, 5.1], [0, 0, 0], [0, 0, 0]]))
+        np.testing.assert_array_equal(mask, [False, True, False])
+        self.assertEqual(len(voxels), 4)
+        np.testing.assert_array_equal(voxels.add(np.zeros((3, 0))), np.zeros(0, dtype=bool))
+
+    def test_many_calls(self):
+        """Compare many calls to add() with a set of voxel coordinates."""
+        rng = np.random.RandomState(0)
+        voxels = VoxelSet(0.7)
+        seen = set()
+        for nbr_points in rng.randint(0, 300, 40):
+            points = rng.randn(3, nbr_points) * 5
+            expected = []
+            for coords in map(tuple, np.floor(points / 0.7).astype(np.int64).T):
+                expected.append(coords not in seen)
+                seen.add(coords)
+            np.testing.assert_array_equal(voxels.add(points), expected)
+            self.assertEqual(len(voxels), len(seen))
+
+    def test_invalid(self):
+        """Test invalid voxel sizes and points outside the range of the voxel keys."""
+        with self.assertRaises(ValueError):
+            VoxelSet(0)
+        with self.assertRaises(ValueError):
+            VoxelSet(-1.0)
+
+        voxels = VoxelSet(0.1)
+        limit = 0.1 * 2 ** (VoxelSet.BITS - 1)
+        for point in [[limit * 1.01, 0, 0], [0, -limit * 1.01, 0], [0, 0, 1e12]]:
+            with self.assertRaises(ValueError):
+                voxels.add(np.array(point).reshape(3, 1))
+        self.assertEqual(len(voxels), 0)
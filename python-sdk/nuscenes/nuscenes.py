@@ -5,9 +5,13 @@
 from __future__ import annotations
 
 import json
+import os
+import pickle
+import shutil
 import time
 import sys
 import os.path as osp
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from typing import Tuple, List
 
@@ -23,71 +27,439 @@ from tqdm import tqdm
 from matplotlib.patches import Ellipse, Circle
 
 from nuscenes.utils.map_mask import MapMask
-from nuscenes.utils.data_classes import LidarPointCloud, RadarPointCloud, Box
-from nuscenes.utils.geometry_utils import view_points, box_in_image, quaternion_slerp, BoxVisibility
-
+from nuscenes.utils.frame_writer import FrameWriter
+from nuscenes.utils.array_table import ArrayTable, TokenIndex, encode_tokens, COMPACT_TOKEN_DTYPE
+from nuscenes.utils.data_classes import PointCloud, LidarPointCloud, RadarPointCloud, Box
+from nuscenes.utils.geometry_utils import view_points, box_in_image, quaternion_slerp, BoxVisibility, \
+    quaternions_to_rotation_matrices
+
+# Use a faster JSON parser if one is installed. Both produce the same tables as the json module.
+try:
+    import orjson as fast_json
+except ImportError:
+    try:
+        import ujson as fast_json
+    except ImportError:
+        fast_json = None
 
 PYTHON_VERSION = sys.version_info[0]
 
+# Increment whenever the layout of the binary table cache changes.
+CACHE_FORMAT_VERSION = 3
+
+# Tables that are stored column-wise with table_backend='array', with the table that each link field points to.
+ARRAY_TABLE_LINKS = {
+    'ego_pose': {},
+    'sample_data': {'sample_token': 'sample', 'ego_pose_token': 'ego_pose',
+                    'calibrated_sensor_token': 'calibrated_sensor', 'prev': 'sample_data', 'next': 'sample_data'},
+    'sample_annotation': {'sample_token': 'sample', 'instance_token': 'instance', 'visibility_token': 'visibility',
+                          'attribute_tokens': 'attribute', 'prev': 'sample_annotation', 'next': 'sample_annotation'}
+}
+
 if not PYTHON_VERSION == 3:
     raise ValueError("nuScenes dev-kit only supports Python version 3.")
 
 
+def _index_key(value):
+    """
+    Converts a field value into a key for a secondary index. Lists are converted to tuples.
+    :param value: Field value.
+    :return: A hashable key that compares equal for equal field values.
+    """
+    if isinstance(value, list):
+        return tuple(_index_key(v) for v in value)
+    hash(value)  # Raises a TypeError for unhashable values.
+    return value
+
+
+def _read_table(path: str) -> Tuple[List[dict], float]:
+    """
+    Parses a JSON table, using the faster parser if available. This can run in a worker process.
+    :param path: Path to the JSON file.
+    :return: (table, parse_time). The records of the table and the time it took to parse them in seconds.
+    """
+    start_time = time.time()
+    if fast_json is not None:
+        with open(path, 'rb') as f:
+            table = fast_json.loads(f.read())
+    else:
+        with open(path) as f:
+            table = json.load(f)
+    return table, time.time() - start_time
+
+
+def _intern_tokens(table: List[dict]) -> None:
+    """
+    Interns all tokens of a table in place, so that each token is stored as a single string object that is shared by
+    all records referring to it. This only saves memory, dict lookups are as fast as before.
+    :param table: The records of a table.
+    """
+    for record in table:
+        for key, value in record.items():
+            if key == 'token' or key.endswith('_token') or key in ['prev', 'next']:
+                record[key] = sys.intern(value)
+            elif key.endswith('_tokens'):
+                record[key] = [sys.intern(v) for v in value]
+
+
+class LazyRecord(dict):
+    """
+    Record whose reverse-indexed fields are only computed when they are first accessed.
+    This is used in lazy mode for fields that require loading another, potentially large table.
+    Accessing a deferred field by key or get() computes that field. Iterating over the record, comparing or copying it
+    computes all deferred fields, so that the record behaves like the eagerly loaded one.
+    """
+
+    def __init__(self, record: dict, resolvers: dict):
+        """
+        :param record: The record to wrap.
+        :param resolvers: Maps each deferred field to a function that adds the field to the record.
+        """
+        super().__init__(record)
+        self._resolvers = resolvers
+
+    def _resolve_all(self) -> None:
+        """ Computes all deferred fields that are still missing. """
+        for key, resolver in self._resolvers.items():
+            if not dict.__contains__(self, key):
+                resolver()
+
+    def __missing__(self, key):
+        if key not in self._resolvers:
+            raise KeyError(key)
+
+        self._resolvers[key]()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key) -> bool:
+        return dict.__contains__(self, key) or key in self._resolvers
+
+    def __iter__(self):
+        self._resolve_all()
+        return dict.__iter__(self)
+
+    def __len__(self) -> int:
+        self._resolve_all()
+        return dict.__len__(self)
+
+    def __eq__(self, other) -> bool:
+        self._resolve_all()
+        if isinstance(other, LazyRecord):
+            other._resolve_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other) -> bool:
+        return not self == other
+
+    def __repr__(self) -> str:
+        self._resolve_all()
+        return dict.__repr__(self)
+
+    def keys(self):
+        self._resolve_all()
+        return dict.keys(self)
+
+    def values(self):
+        self._resolve_all()
+        return dict.values(self)
+
+    def items(self):
+        self._resolve_all()
+        return dict.items(self)
+
+    def copy(self) -> dict:
+        self._resolve_all()
+        return dict(dict.items(self))
+
+
 class NuScenes:
     """
     Database class for nuScenes to help query and retrieve information from the database.
     """
 
-    def __init__(self, version: str='v0.1', dataroot: str='/data/nuscenes', verbose: bool=True):
+    def __init__(self, version: str='v0.1', dataroot: str='/data/nuscenes', verbose: bool=True,
+                 use_cache: bool=False, lazy: bool=False, table_backend: str='dict', compact_tokens: bool=False,
+                 num_workers: int=1, split: str=None, scenes: List[str]=None, logs: List[str]=None):
         """
         Loads database and creates reverse indexes and shortcuts.
         :param version: Version to load (e.g. "v0.1", ...).
         :param dataroot: Path to the tables and data.
         :param verbose: Whether to print status messages during load.
+        :param use_cache: Whether to read the tables and reverse indexes from a binary cache next to the tables.
+            The cache is (re-)written whenever it is missing or the JSON tables have changed. It stores each column of
+            the large tables in a .npy file that is memory-mapped on load, so it requires table_backend='array'.
+        :param lazy: Whether to defer loading and indexing each table until it is first accessed, either as an
+            attribute or through get()/getind().
+        :param table_backend: How to store the large tables ego_pose, sample_data and sample_annotation.
+            'dict' stores a list of dicts. 'array' stores each field in a contiguous numpy array (see ArrayTable), which
+            uses several times less memory. Records are then returned as read-only dict-like views (see ArrayRecord),
+            which are created on every access. Assigning to a field of such a record raises a TypeError, columns can
+            only be added or replaced for all records with ArrayTable.set_column().
+        :param compact_tokens: Whether to store tokens compactly. Token strings are interned, so that every token is
+            stored only once. With table_backend='array', tokens are additionally stored as 128-bit binary values and
+            indexed by a sorted TokenIndex, which can be shared with worker processes and cached as a plain array.
+            Tokens are converted back to strings on access.
+        :param num_workers: Number of processes used to parse the JSON tables. With more than one, the tables are
+            parsed concurrently and each table is indexed as soon as it has been received from its worker. This only
+            helps with the json module: transferring a parsed table from a worker takes about as long as parsing it
+            with orjson or ujson, so the tables are then always parsed in this process.
+        :param split: Optional split to restrict the database to, e.g. 'train' or 'val'. See create_splits_logs().
+        :param scenes: Optional scene names or tokens to restrict the database to.
+        :param logs: Optional logfile names or log tokens to restrict the database to.
+            If any of split, scenes or logs is set, only the selected scenes and the records they refer to are kept in
+            the log, scene, sample, sample_data, sample_annotation, ego_pose, instance and map tables. The remaining
+            records are dropped right after parsing, so that indexing time and memory scale with the selection.
         """
         if version not in ['v0.1']:
             raise ValueError('Invalid DB version: {}'.format(version))
+        if table_backend not in ['dict', 'array']:
+            raise ValueError('Invalid table backend: {}'.format(table_backend))
+        assert not (use_cache and lazy), 'Error: The table cache cannot be combined with lazy loading!'
+        assert not use_cache or table_backend == 'array', "Error: The table cache requires table_backend='array'!"
+        subset = split is not None or scenes is not None or logs is not None
+        assert not (subset and lazy), 'Error: Scene subsets cannot be combined with lazy loading!'
+        assert not (subset and use_cache), 'Error: Scene subsets cannot be combined with the table cache!'
 
         self.version = version
         self.dataroot = dataroot
+        self.verbose = verbose
+        self.table_backend = table_backend
+        self.compact_tokens = compact_tokens
         self.table_names = ['category', 'attribute', 'visibility', 'instance', 'sensor', 'calibrated_sensor',
                             'ego_pose', 'log', 'scene', 'sample', 'sample_data', 'sample_annotation', 'map']
 
         assert osp.exists(self.table_root), 'Database version not found: {}'.format(self.table_root)
 
+        self.__init_state__()
+
+        if lazy:
+            # Tables are loaded on first access, see __getattr__().
+            self._token2ind = dict()
+            self._lazy_tables = set(self.table_names)
+            if verbose:
+                print("======\nLazy loading NuScenes tables for version {}.\n======".format(self.version))
+        else:
+            self.__load_tables__(verbose, use_cache, num_workers, subset=(split, scenes, logs) if subset else None)
+
+        # Initialize NuScenesExplorer class
+        self.explorer = NuScenesExplorer(self)
+
+    def __init_state__(self) -> None:
+        """ Initializes the bookkeeping and the indexes that are built on demand. """
+        # Parse, index and (with num_workers > 1) wait time in seconds of each table that was loaded from JSON.
+        self.load_times = dict()
+
+        # Tables that are not loaded yet. Only used in lazy mode.
+        self._lazy_tables = set()
+
+        # Secondary indexes that map (table_name, field) to {value: [tokens]}. These are built on demand.
+        self._field_index = dict()
+
+        # Encoded tokens of each table that is linked to from an ArrayTable. Only used with table_backend='array'.
+        self._token_arrays = dict()
+
+        # Ordered samples of each scene and ordered sample_data of each sensor. These are built on demand, see
+        # __make_sample_chains__() and __make_sample_data_chains__().
+        self._scene_samples = None
+        self._sd_chains = None
+
+        # Sorted timestamps of the sample_data of each (scope, channel), see __timestamp_index__().
+        self._timestamp_index = dict()
+
+        # Rotation matrices and translations of the ego_pose and calibrated_sensor tables, see __make_transforms__().
+        self._transforms = dict()
+
+        # Shared memory block that holds the large tables, see share_memory().
+        self._shared_memory = None
+        self._shared_memory_owner = False
+
+    def __getstate__(self) -> dict:
+        """
+        Returns the state to pickle, e.g. to send a loaded instance to a spawned worker process. Unpickling is much
+        faster than reloading the JSON tables, as the tables, reverse indexes and decorations are restored as they are.
+        Pending lazy tables are loaded first. Map masks are pickled by path and the indexes that are built on demand
+        are not pickled.
+        :return: The state to pickle.
+        """
+        for table_name in self.table_names:
+            getattr(self, table_name)
+
+        state = dict(self.__dict__)
+        del state['explorer']
+
+        # Lazy samples hold resolvers that cannot be pickled. All tables are loaded, so they are plain dicts now.
+        if any(isinstance(record, LazyRecord) for record in self.sample):
+            state['sample'] = [dict(record) for record in self.sample]
+
+        # A shared memory block cannot be pickled, the arrays in it are pickled by value.
+        state['_shared_memory'] = None
+        state['_shared_memory_owner'] = False
+
+        state['_field_index'] = dict()
+        state['_scene_samples'] = None
+        state['_sd_chains'] = None
+        state['_timestamp_index'] = dict()
+        state['_transforms'] = dict()
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Restores a pickled instance.
+        :param state: The state returned by __getstate__().
+        """
+        self.__dict__.update(state)
+        self.explorer = NuScenesExplorer(self)
+
+    def __load_tables__(self, verbose: bool, use_cache: bool, num_workers: int, subset: tuple=None) -> None:
+        """
+        Eagerly loads all tables and creates the reverse indexes.
+        :param verbose: Whether to print outputs.
+        :param use_cache: Whether to use the binary table cache.
+        :param num_workers: Number of processes used to parse the JSON tables.
+        :param subset: Optional (split, scenes, logs) to restrict the tables to, see __select_scenes__().
+        """
         start_time = time.time()
         if verbose:
             print("======\nLoading NuScenes tables for version {} ...".format(self.version))
 
-        # Explicitly assign tables to help the IDE determine valid class members.
-        self.category = self.__load_table__('category')
-        self.attribute = self.__load_table__('attribute')
-        self.visibility = self.__load_table__('visibility')
-        self.instance = self.__load_table__('instance')
-        self.sensor = self.__load_table__('sensor')
-        self.calibrated_sensor = self.__load_table__('calibrated_sensor')
-        self.ego_pose = self.__load_table__('ego_pose')
-        self.log = self.__load_table__('log')
-        self.scene = self.__load_table__('scene')
-        self.sample = self.__load_table__('sample')
-        self.sample_data = self.__load_table__('sample_data')
-        self.sample_annotation = self.__load_table__('sample_annotation')
-        self.map = self.__load_table__('map')
+        # Try the binary cache first. It already contains the reverse indexes.
+        cache_loaded = use_cache and self.__load_cache__(verbose)
+
+        if not cache_loaded:
+            self._token2ind = dict()
+            if num_workers > 1 and fast_json is not None:
+                # Unpickling a table that a worker has parsed takes about as long as parsing it with the fast parser.
+                if verbose:
+                    print("Parsing tables in this process, as {} parses them about as fast as they can be received "
+                          "from worker processes.".format(fast_json.__name__))
+                num_workers = 1
+
+            if num_workers > 1:
+                tables = self.__load_tables_parallel__(num_workers)
+            else:
+                tables = {table_name: self.__load_table__(table_name) for table_name in self.table_names}
+
+            # Explicitly assign tables to help the IDE determine valid class members.
+            self.category = tables['category']
+            self.attribute = tables['attribute']
+            self.visibility = tables['visibility']
+            self.instance = tables['instance']
+            self.sensor = tables['sensor']
+            self.calibrated_sensor = tables['calibrated_sensor']
+            self.ego_pose = tables['ego_pose']
+            self.log = tables['log']
+            self.scene = tables['scene']
+            self.sample = tables['sample']
+            self.sample_data = tables['sample_data']
+            self.sample_annotation = tables['sample_annotation']
+            self.map = tables['map']
+
+            if subset is not None:
+                self.__select_scenes__(*subset)
 
         # Initialize map mask for each map record.
         for map_record in self.map:
             map_record['mask'] = MapMask(osp.join(self.dataroot, map_record['filename']))
 
         if verbose:
+            if not cache_loaded:
+                print("Parsed tables with {}.".format(fast_json.__name__ if fast_json is not None else 'json'))
             for table in self.table_names:
-                print("{} {},".format(len(getattr(self, table)), table))
+                if table in self.load_times and 'wait' in self.load_times[table]:
+                    print("{} {}, parsed in {:.2f}s, waited {:.2f}s to receive, indexed in {:.2f}s,".format(
+                        len(getattr(self, table)), table, self.load_times[table]['parse'],
+                        self.load_times[table]['wait'], self.load_times[table]['index']))
+                elif table in self.load_times:
+                    print("{} {}, parsed in {:.2f}s, indexed in {:.2f}s,".format(
+                        len(getattr(self, table)), table, self.load_times[table]['parse'],
+                        self.load_times[table]['index']))
+                else:
+                    print("{} {},".format(len(getattr(self, table)), table))
             print("Done loading in {:.1f} seconds.\n======".format(time.time() - start_time))
 
-        # Make reverse indexes for common lookups.
-        self.__make_reverse_index__(verbose)
+        if not cache_loaded:
+            # Make reverse indexes for common lookups.
+            self.__make_reverse_index__(verbose)
 
-        # Initialize NuScenesExplorer class
-        self.explorer = NuScenesExplorer(self)
+            if use_cache:
+                self.__save_cache__(verbose)
+
+    def __getattr__(self, name: str):
+        """
+        Loads a table on first access in lazy mode. This is only called if the attribute does not exist yet.
+        :param name: Attribute name.
+        :return: The table.
+        """
+        if name in self.__dict__.get('_lazy_tables', ()):
+            self.__load_lazy_table__(name)
+            return self.__dict__[name]
+
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    def __load_lazy_table__(self, table_name: str) -> None:
+        """
+        Loads and indexes a single table in lazy mode and adds the decorations that depend on it.
+        Tables that are needed for these decorations are loaded as well.
+        :param table_name: Table name.
+        """
+        start_time = time.time()
+
+        # Load the tables that are needed to decorate this table first.
+        dependencies = {'log': ['map'], 'sample_data': ['calibrated_sensor', 'sensor'],
+                        'sample_annotation': ['instance', 'category']}.get(table_name, [])
+        if self.table_backend == 'array' and table_name in ARRAY_TABLE_LINKS:
+            dependencies += [t for t in ARRAY_TABLE_LINKS[table_name].values() if t != table_name]
+        for dependency in dependencies:
+            if dependency in self._lazy_tables:
+                self.__load_lazy_table__(dependency)
+
+        self._lazy_tables.discard(table_name)
+        table = self.__load_table__(table_name)
+        setattr(self, table_name, table)
+
+        if self.table_backend == 'array' and table_name in ARRAY_TABLE_LINKS:
+            self.__make_array_table__(table_name)
+
+        if table_name == 'map':
+            for map_record in self.map:
+                map_record['mask'] = MapMask(osp.join(self.dataroot, map_record['filename']))
+
+        elif table_name == 'log':
+            self.__decorate_log__()
+
+        elif table_name == 'sample':
+            # The sample_data and annotation tokens of a sample are reverse indexed from the large sample_data and
+            # sample_annotation tables. Defer them until they are accessed or the other table gets loaded.
+            resolvers = {}
+            if 'sample_data' in self._lazy_tables:
+                resolvers['data'] = lambda: getattr(self, 'sample_data')
+            else:
+                self.__index_sample_data__()
+            if 'sample_annotation' in self._lazy_tables:
+                resolvers['anns'] = lambda: getattr(self, 'sample_annotation')
+            else:
+                self.__index_sample_annotation__()
+            if len(resolvers) > 0:
+                self.sample = [LazyRecord(record, resolvers) for record in self.sample]
+
+        elif table_name == 'sample_data':
+            self.__decorate_sample_data__()
+            if 'sample' not in self._lazy_tables:
+                self.__index_sample_data__()
+
+        elif table_name == 'sample_annotation':
+            self.__decorate_sample_annotation__()
+            if 'sample' not in self._lazy_tables:
+                self.__index_sample_annotation__()
+
+        if self.verbose:
+            print("Loaded {} {} in {:.1f} seconds.".format(len(table), table_name, time.time() - start_time))
 
     @property
     def table_root(self) -> str:
@@ -95,11 +467,374 @@ class NuScenes:
         return osp.join(self.dataroot, self.version)
 
     def __load_table__(self, table_name) -> dict:
-        """ Loads a table. """
-        with open(osp.join(self.table_root, '{}.json'.format(table_name))) as f:
-            table = json.load(f)
+        """ Loads a table and indexes its tokens. """
+        table, parse_time = _read_table(osp.join(self.table_root, '{}.json'.format(table_name)))
+        return self.__index_table__(table_name, table, parse_time)
+
+    def __select_scenes__(self, split: str=None, scenes: List[str]=None, logs: List[str]=None) -> None:
+        """
+        Restricts the loaded tables to a subset of scenes and re-indexes the pruned tables.
+        Only the selected scenes and the logs, maps, samples, sample_data, sample_annotations, ego_poses and instances
+        that they refer to are kept. The prev and next links of sample_data and sample_annotations to records of other
+        scenes are set to ''.
+        :param split: Optional split name, e.g. 'train' or 'val'.
+        :param scenes: Optional scene names or tokens.
+        :param logs: Optional logfile names or log tokens.
+        """
+        log_tokens = {record['token'] for record in self.log}
+        if split is not None:
+            # Imported here, as create_splits_logs imports this module.
+            from nuscenes.eval.create_splits_logs import create_splits_logs
+            splits = create_splits_logs(self)
+            if split not in splits:
+                raise ValueError('Invalid split: {}'.format(split))
+            log_tokens &= {record['token'] for record in self.log if record['logfile'] in splits[split]}
+        if logs is not None:
+            logs = set(logs)
+            log_tokens &= {record['token'] for record in self.log
+                           if record['logfile'] in logs or record['token'] in logs}
+        if scenes is not None:
+            scenes = set(scenes)
+
+        self.scene = [record for record in self.scene if record['log_token'] in log_tokens and
+                      (scenes is None or record['name'] in scenes or record['token'] in scenes)]
+        scene_tokens = {record['token'] for record in self.scene}
+        log_tokens = {record['log_token'] for record in self.scene}
+        self.log = [record for record in self.log if record['token'] in log_tokens]
+        self.map = [record for record in self.map if record['log_token'] in log_tokens]
+
+        self.sample = [record for record in self.sample if record['scene_token'] in scene_tokens]
+        sample_tokens = {record['token'] for record in self.sample}
+        self.sample_data = [record for record in self.sample_data if record['sample_token'] in sample_tokens]
+        ego_pose_tokens = {record['ego_pose_token'] for record in self.sample_data}
+        self.ego_pose = [record for record in self.ego_pose if record['token'] in ego_pose_tokens]
+        self.sample_annotation = [record for record in self.sample_annotation
+                                  if record['sample_token'] in sample_tokens]
+        instance_tokens = {record['instance_token'] for record in self.sample_annotation}
+        self.instance = [record for record in self.instance if record['token'] in instance_tokens]
+
+        # The sample_data of a sensor are linked across the scenes of a log. Links to pruned records are cleared, as
+        # at the first and last record of a chain. The records are freshly parsed, so they can be modified in place.
+        for table_name in ['sample_data', 'sample_annotation']:
+            table = getattr(self, table_name)
+            tokens = {record['token'] for record in table}
+            for record in table:
+                for field in ['prev', 'next']:
+                    if record[field] != '' and record[field] not in tokens:
+                        record[field] = ''
+
+        for table_name in ['log', 'map', 'scene', 'sample', 'sample_data', 'ego_pose', 'sample_annotation', 'instance']:
+            self.__index_table__(table_name, getattr(self, table_name), self.load_times[table_name]['parse'],
+                                 self.load_times[table_name].get('wait'))
+
+    def __load_tables_parallel__(self, num_workers: int) -> dict:
+        """
+        Parses all tables concurrently in a process pool. Each table is indexed in this process while the remaining
+        tables are still being parsed.
+        The parsed tables are pickled by the workers and unpickled one after another in this process, which takes
+        about as long as parsing them with orjson. The pool therefore only pays off with the slower json module.
+        The time this process waits to receive each table is recorded in load_times[table_name]['wait'].
+        :param num_workers: Number of worker processes.
+        :return: The records of each table by table name.
+        """
+        # Submit the largest tables first, as they take the longest to parse.
+        paths = {table_name: osp.join(self.table_root, '{}.json'.format(table_name)) for table_name in self.table_names}
+        table_names = sorted(self.table_names, key=lambda table_name: -osp.getsize(paths[table_name]))
+
+        tables = dict()
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = {executor.submit(_read_table, paths[table_name]): table_name for table_name in table_names}
+            wait_start = time.time()
+            for future in as_completed(futures):
+                table_name = futures[future]
+                table, parse_time = future.result()
+                wait_time = time.time() - wait_start
+                tables[table_name] = self.__index_table__(table_name, table, parse_time, wait_time)
+                wait_start = time.time()
+        return tables
+
+    def __index_table__(self, table_name: str, table: List[dict], parse_time: float, wait_time: float=None) \
+            -> List[dict]:
+        """
+        Stores the mapping from token to table index for a freshly parsed table and records its load times.
+        :param table_name: Table name.
+        :param table: The records of the table.
+        :param parse_time: The time it took to parse the table in seconds.
+        :param wait_time: The time this process waited to receive the table from a worker process in seconds, which
+            includes the time to transfer and unpickle it. None if the table was parsed in this process.
+        :return: The table.
+        """
+        start_time = time.time()
+        if self.compact_tokens:
+            _intern_tokens(table)
+        self._token2ind[table_name] = {member['token']: ind for ind, member in enumerate(table)}
+        self.load_times[table_name] = {'parse': parse_time, 'index': time.time() - start_time}
+        if wait_time is not None:
+            self.load_times[table_name]['wait'] = wait_time
+
         return table
 
+    @property
+    def cache_path(self) -> str:
+        """ Returns the folder of the binary table cache for the relevant version and token storage. """
+        return osp.join(self.table_root, '.cache', 'tables_{}{}'.format(
+            self.table_backend, '_compact' if self.compact_tokens else ''))
+
+    def __cache_key__(self) -> tuple:
+        """
+        Identifies the state of the JSON tables. The cache is only valid if this key did not change.
+        :return: The cache format version and the (table name, mtime, size) tuple of each JSON table.
+        """
+        key = [CACHE_FORMAT_VERSION]
+        for table_name in self.table_names:
+            stat = os.stat(osp.join(self.table_root, '{}.json'.format(table_name)))
+            key.append((table_name, stat.st_mtime_ns, stat.st_size))
+        return tuple(key)
+
+    def __load_cache__(self, verbose: bool) -> bool:
+        """
+        Loads the tables and reverse indexes from the binary cache. The columns of the large tables are memory-mapped
+        rather than read, so that only the pages that are accessed are loaded from disk.
+        :param verbose: Whether to print outputs.
+        :return: Whether the cache was valid and has been loaded.
+        """
+        state_path = osp.join(self.cache_path, 'tables.pkl')
+        if not osp.exists(state_path):
+            return False
+
+        try:
+            with open(state_path, 'rb') as f:
+                # The key is stored in front of the payload, so that stale caches are rejected without reading them.
+                if pickle.load(f) != self.__cache_key__():
+                    if verbose:
+                        print("Table cache is outdated, reloading from JSON.")
+                    return False
+                array_names, tables, token2ind = pickle.load(f)
+            arrays = {name: np.load(osp.join(self.cache_path, name + '.npy'), mmap_mode='r') for name in array_names}
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError) as e:
+            if verbose:
+                print("Could not read table cache: {}".format(e))
+            return False
+
+        self.__restore_tables__(tables, token2ind, arrays)
+
+        if verbose:
+            print("Loaded tables from cache {}".format(self.cache_path))
+        return True
+
+    def __save_cache__(self, verbose: bool) -> None:
+        """
+        Writes the tables and reverse indexes to the binary cache. Every column of the large tables and every token
+        array is stored in its own .npy file, the small tables are pickled.
+        :param verbose: Whether to print outputs.
+        """
+        arrays, tables, token2ind = self.__table_arrays__()
+
+        # Write to a temporary folder first so that concurrent readers never see a partial cache.
+        tmp_path = '{}.{}.tmp'.format(self.cache_path, os.getpid())
+        old_path = '{}.{}.old'.format(self.cache_path, os.getpid())
+        try:
+            for name, array in arrays.items():
+                path = osp.join(tmp_path, name + '.npy')
+                os.makedirs(osp.dirname(path), exist_ok=True)
+                np.save(path, array)
+            with open(osp.join(tmp_path, 'tables.pkl'), 'wb') as f:
+                pickle.dump(self.__cache_key__(), f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump((list(arrays.keys()), tables, token2ind), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+            # A folder cannot replace a non-empty folder, so an outdated cache is moved aside first.
+            if osp.exists(self.cache_path):
+                os.replace(self.cache_path, old_path)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            if verbose:
+                print("Could not write table cache: {}".format(e))
+            return
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            shutil.rmtree(old_path, ignore_errors=True)
+
+        if verbose:
+            print("Saved tables to cache {}".format(self.cache_path))
+
+    def __table_arrays__(self) -> Tuple[dict, dict, dict]:
+        """
+        Splits the tables and reverse indexes into numpy arrays and the remaining picklable state, so that the arrays
+        can be stored in shared memory or in column files. See __restore_tables__() for the reverse.
+        Pending lazy tables are loaded first.
+        :return: (arrays, tables, token2ind). The arrays by name, the small tables and the layout of each ArrayTable
+            by table name, and the token to row index dict of each table (None for a TokenIndex).
+        """
+        for table_name in self.table_names:
+            getattr(self, table_name)
+
+        arrays = dict()
+        tables = dict()
+        token2ind = dict()
+        for table_name in self.table_names:
+            table = getattr(self, table_name)
+            if isinstance(table, ArrayTable):
+                array_fields = [field for field, column in table.columns.items() if column.dtype != object]
+                tables[table_name] = {
+                    'kinds': table.kinds,
+                    'links': table.links,
+                    'nbr_rows': len(table),
+                    'shared': array_fields,
+                    'objects': {field: column for field, column in table.columns.items() if column.dtype == object}
+                }
+                for field in array_fields:
+                    arrays['{}/{}'.format(table_name, field)] = table.columns[field]
+            else:
+                # Map masks are not stored, they are recreated from their image files.
+                tables[table_name] = [{k: v for k, v in record.items() if k != 'mask'} for record in table]
+
+            index = self._token2ind[table_name]
+            if isinstance(index, TokenIndex):
+                arrays['{}/index.keys'.format(table_name)] = index.sorted_keys
+                arrays['{}/index.order'.format(table_name)] = index.order
+                token2ind[table_name] = None
+            else:
+                token2ind[table_name] = index
+
+        for table_name, tokens in self._token_arrays.items():
+            arrays['tokens/{}'.format(table_name)] = tokens
+
+        return arrays, tables, token2ind
+
+    def __restore_tables__(self, tables: dict, token2ind: dict, arrays: dict) -> None:
+        """
+        Sets the tables and reverse indexes from the output of __table_arrays__(). The arrays are used as they are,
+        e.g. as views into shared memory or memory-mapped column files.
+        Map masks are not restored.
+        :param tables: The small tables and the layout of each ArrayTable by table name.
+        :param token2ind: The token to row index dict of each table (None for a TokenIndex).
+        :param arrays: The arrays by name.
+        """
+        self._token_arrays = {name[len('tokens/'):]: array for name, array in arrays.items()
+                              if name.startswith('tokens/')}
+        self._token2ind = dict()
+        for table_name in self.table_names:
+            table = tables[table_name]
+            if isinstance(table, dict):
+                columns = {field: arrays['{}/{}'.format(table_name, field)] for field in table['shared']}
+                columns.update(table['objects'])
+                table = ArrayTable.from_columns(columns, table['kinds'], table['links'], self._token_arrays,
+                                                table['nbr_rows'])
+            setattr(self, table_name, table)
+
+            if token2ind[table_name] is None:
+                self._token2ind[table_name] = TokenIndex.from_arrays(arrays['{}/index.keys'.format(table_name)],
+                                                                     arrays['{}/index.order'.format(table_name)])
+            else:
+                self._token2ind[table_name] = token2ind[table_name]
+
+    def share_memory(self) -> dict:
+        """
+        Moves the tables and reverse indexes into a shared memory block, so that worker processes can use them without
+        holding a copy each, see attach_shared_memory(). This instance then uses the shared block as well, so that
+        forked workers do not copy the tables either.
+        Only numpy arrays can be shared, so this requires table_backend='array' and compact_tokens=True. The large
+        tables and their token indexes are shared, the small tables are included in the returned handle.
+        Requires Python 3.8 or later.
+        :return: A picklable handle to pass to the worker processes.
+        """
+        assert self.table_backend == 'array' and self.compact_tokens, \
+            "Error: Shared memory requires table_backend='array' and compact_tokens=True!"
+        assert self._shared_memory is None, 'Error: The tables are already in shared memory!'
+        from nuscenes.utils.shared_tables import pack_arrays
+
+        arrays, tables, token2ind = self.__table_arrays__()
+        self._shared_memory, views, layout = pack_arrays(arrays)
+        self._shared_memory_owner = True
+
+        # Replace the arrays of this instance by their shared copies.
+        self.__replace_arrays__(tables, token2ind, views)
+
+        state = {
+            'version': self.version,
+            'dataroot': self.dataroot,
+            'table_names': self.table_names,
+            'tables': tables,
+            'token2ind': token2ind
+        }
+        return {'layout': layout, 'state': state}
+
+    @classmethod
+    def attach_shared_memory(cls, handle: dict, verbose: bool=False) -> NuScenes:
+        """
+        Creates a NuScenes instance from tables in shared memory, e.g. in a worker process. The shared tables are
+        read-only. Records of the small tables can still be modified, but the changes are only visible in this process.
+        :param handle: The handle returned by share_memory() in the parent process.
+        :param verbose: Whether to print status messages.
+        :return: The NuScenes instance.
+        """
+        from nuscenes.utils.shared_tables import attach_arrays
+
+        state = handle['state']
+        nusc = cls.__new__(cls)
+        nusc.version = state['version']
+        nusc.dataroot = state['dataroot']
+        nusc.verbose = verbose
+        nusc.table_backend = 'array'
+        nusc.compact_tokens = True
+        nusc.table_names = list(state['table_names'])
+        nusc.__init_state__()
+
+        nusc._shared_memory, views = attach_arrays(handle['layout'])
+        nusc.__restore_tables__(state['tables'], state['token2ind'], views)
+
+        for map_record in nusc.map:
+            map_record['mask'] = MapMask(osp.join(nusc.dataroot, map_record['filename']))
+
+        nusc.explorer = NuScenesExplorer(nusc)
+        if verbose:
+            print("Attached to NuScenes tables in shared memory {}.".format(handle['layout']['name']))
+        return nusc
+
+    def release_shared_memory(self) -> None:
+        """
+        Releases the shared memory block created by share_memory(). The tables of this instance are copied back to
+        private memory, so that share_memory() can be called again. The block is freed as soon as all worker processes
+        that use it have exited, and no new workers can attach to it afterwards.
+        Arrays that were taken from the shared tables before, e.g. with ArrayTable.column(), must not be used anymore.
+        """
+        if self._shared_memory is None or not self._shared_memory_owner:
+            return
+
+        arrays, tables, token2ind = self.__table_arrays__()
+        self.__replace_arrays__(tables, token2ind, {name: np.array(array) for name, array in arrays.items()})
+
+        # The indexes that are built on demand may hold views into the block.
+        self._field_index = dict()
+        self._scene_samples = None
+        self._sd_chains = None
+        self._timestamp_index = dict()
+        self._transforms = dict()
+
+        self._shared_memory.unlink()
+        self._shared_memory.close()
+        self._shared_memory = None
+        self._shared_memory_owner = False
+
+    def __replace_arrays__(self, tables: dict, token2ind: dict, arrays: dict) -> None:
+        """
+        Replaces the arrays of the tables and reverse indexes by other arrays with the same content, e.g. by copies in
+        shared memory.
+        :param tables: The small tables and the layout of each ArrayTable by table name, see __table_arrays__().
+        :param token2ind: The token to row index dict of each table (None for a TokenIndex), see __table_arrays__().
+        :param arrays: The arrays by name, see __table_arrays__().
+        """
+        for table_name in self.table_names:
+            table = getattr(self, table_name)
+            if isinstance(table, ArrayTable):
+                for field in tables[table_name]['shared']:
+                    table.columns[field] = arrays['{}/{}'.format(table_name, field)]
+            if token2ind[table_name] is None:
+                self._token2ind[table_name] = TokenIndex.from_arrays(arrays['{}/index.keys'.format(table_name)],
+                                                                     arrays['{}/index.order'.format(table_name)])
+        for table_name in self._token_arrays:
+            self._token_arrays[table_name] = arrays['tokens/{}'.format(table_name)]
+
     def __make_reverse_index__(self, verbose: bool) -> None:
         """
         De-normalizes database to create reverse indices for common cases.
@@ -110,48 +845,115 @@ class NuScenes:
         if verbose:
             print("Reverse indexing ...")
 
-        # Store the mapping from token to table index for each table.
-        self._token2ind = dict()
-        for table in self.table_names:
-            self._token2ind[table] = dict()
+        # The mapping from token to table index of each table is stored when the table is loaded, see __index_table__().
+        if self.table_backend == 'array':
+            for table_name in ARRAY_TABLE_LINKS:
+                self.__make_array_table__(table_name)
 
-            for ind, member in enumerate(getattr(self, table)):
-                self._token2ind[table][member['token']] = ind
+        self.__decorate_sample_annotation__()
+        self.__decorate_sample_data__()
+        self.__index_sample_data__()
+        self.__index_sample_annotation__()
+        self.__decorate_log__()
+
+        if verbose:
+            print("Done reverse indexing in {:.1f} seconds.\n======".format(time.time() - start_time))
+    
+    def __make_array_table__(self, table_name: str) -> None:
+        """
+        Converts a table from a list of dicts to an ArrayTable. The tables it links to must be loaded and indexed.
+        :param table_name: Table name, one of ARRAY_TABLE_LINKS.
+        """
+        links = ARRAY_TABLE_LINKS[table_name]
+        for target in set(links.values()):
+            if target != table_name and target not in self._token_arrays:
+                self._token_arrays[target] = encode_tokens([member['token'] for member in getattr(self, target)],
+                                                           compact=self.compact_tokens)
+
+        # Empty tables, e.g. of an empty scene subset, have no columns and are kept as lists.
+        if len(getattr(self, table_name)) == 0:
+            self._token_arrays[table_name] = encode_tokens([], compact=self.compact_tokens)
+            return
+
+        table = ArrayTable(getattr(self, table_name), links, self._token2ind, self._token_arrays,
+                           compact_tokens=self.compact_tokens)
+        self._token_arrays[table_name] = table.columns['token']
+        setattr(self, table_name, table)
+
+        # Replace the dict of token strings by a sorted index of the binary tokens.
+        if table.columns['token'].dtype == COMPACT_TOKEN_DTYPE:
+            self._token2ind[table_name] = TokenIndex(table.columns['token'])
+
+    def __decorate_sample_annotation__(self) -> None:
+        """ Decorate (adds short-cut) sample_annotation table with for category name. """
+        if isinstance(self.sample_annotation, ArrayTable):
+            category_names = np.array([self.get('category', inst['category_token'])['name'] for inst in self.instance],
+                                      dtype=object)
+            instance_inds = self.sample_annotation.column('instance_token')
+            self.sample_annotation.set_column('category_name', category_names[instance_inds])
+            return
 
-        # Decorate (adds short-cut) sample_annotation table with for category name.
         for record in self.sample_annotation:
             inst = self.get('instance', record['instance_token'])
             record['category_name'] = self.get('category', inst['category_token'])['name']
 
-        # Decorate (adds short-cut) sample_data with sensor information.
+    def __decorate_sample_data__(self) -> None:
+        """ Decorate (adds short-cut) sample_data with sensor information. """
+        if isinstance(self.sample_data, ArrayTable):
+            sensor_records = [self.get('sensor', cs_record['sensor_token']) for cs_record in self.calibrated_sensor]
+            modalities = np.array([sensor_record['modality'] for sensor_record in sensor_records], dtype=object)
+            channels = np.array([sensor_record['channel'] for sensor_record in sensor_records], dtype=object)
+            cs_inds = self.sample_data.column('calibrated_sensor_token')
+            self.sample_data.set_column('sensor_modality', modalities[cs_inds])
+            self.sample_data.set_column('channel', channels[cs_inds])
+            return
+
         for record in self.sample_data:
             cs_record = self.get('calibrated_sensor', record['calibrated_sensor_token'])
             sensor_record = self.get('sensor', cs_record['sensor_token'])
             record['sensor_modality'] = sensor_record['modality']
             record['channel'] = sensor_record['channel']
 
-        # Reverse-index samples with sample_data and annotations.
+    def __index_sample_data__(self) -> None:
+        """ Reverse-index samples with sample_data. """
         for record in self.sample:
             record['data'] = {}
-            record['anns'] = []
+
+        if isinstance(self.sample_data, ArrayTable):
+            sample_inds = self.sample_data.column('sample_token')
+            channels = self.sample_data.column('channel')
+            tokens = self.sample_data.column('token')
+            for ind in np.flatnonzero(self.sample_data.column('is_key_frame')):
+                self.sample[sample_inds[ind]]['data'][channels[ind]] = tokens[ind]
+            return
 
         for record in self.sample_data:
             if record['is_key_frame']:
                 sample_record = self.get('sample', record['sample_token'])
                 sample_record['data'][record['channel']] = record['token']
 
+    def __index_sample_annotation__(self) -> None:
+        """ Reverse-index samples with annotations. """
+        for record in self.sample:
+            record['anns'] = []
+
+        if isinstance(self.sample_annotation, ArrayTable):
+            sample_inds = self.sample_annotation.column('sample_token')
+            tokens = self.sample_annotation.column('token')
+            for sample_ind, token in zip(sample_inds, tokens):
+                self.sample[sample_ind]['anns'].append(token)
+            return
+
         for ann_record in self.sample_annotation:
             sample_record = self.get('sample', ann_record['sample_token'])
             sample_record['anns'].append(ann_record['token'])
 
-        # Add reverse indices from log records to map records.
+    def __decorate_log__(self) -> None:
+        """ Add reverse indices from log records to map records. """
         for log_record in self.log:
             map_token = self.field2token('map', 'log_token', log_record['token'])[0]
             log_record['map_token'] = self.get('map', map_token)['token']
 
-        if verbose:
-            print("Done reverse indexing in {:.1f} seconds.\n======".format(time.time() - start_time))
-    
     def get(self, table_name: str, token: str) -> dict:
         """
         Returns a record from table in constant runtime.
@@ -170,23 +972,406 @@ class NuScenes:
         :param token: Token of the record.
         :return: The index of the record in table, table is an array.
         """
+        if table_name in self._lazy_tables:
+            self.__load_lazy_table__(table_name)
+
         return self._token2ind[table_name][token]
 
+    def create_index(self, table_name: str, field: str) -> None:
+        """
+        Creates a secondary index that maps each value of a field to the tokens of the matching records.
+        This runs in linear time once, after which lookup() and field2token() run in constant time for this field.
+        Note that the index is not updated if the field is modified after the index was created.
+        :param table_name: Table name.
+        :param field: Field name. See README.md for details. The values of the field must be hashable, lists are
+            converted to tuples.
+        """
+        index = dict()
+        for member in getattr(self, table_name):
+            index.setdefault(_index_key(member[field]), []).append(member['token'])
+        self._field_index[(table_name, field)] = index
+
+    def lookup(self, table_name: str, field: str, query) -> List[str]:
+        """
+        Returns the tokens of all records with a certain field value, using a secondary index.
+        The index is created on the first lookup of each field.
+        :param table_name: Table name.
+        :param field: Field name. See README.md for details.
+        :param query: Query to match against. Needs to type match the content of the query field.
+        :return: List of tokens for the matching records.
+        """
+        if (table_name, field) not in self._field_index:
+            self.create_index(table_name, field)
+
+        return list(self._field_index[(table_name, field)].get(_index_key(query), []))
+
     def field2token(self, table_name: str, field: str, query) -> List[str]:
         """
         This function queries all record for a certain field value, and returns the tokens for the matching records.
-        Warning: this runs in linear time.
+        The query is served from a secondary index (see lookup()), which is created on the first query of a field.
+        Fields with unhashable values, such as dicts, are scanned in linear time.
         :param table_name: Table name.
         :param field: Field name. See README.md for details.
         :param query: Query to match against. Needs to type match the content of the query field.
         :return: List of tokens for the matching records.
         """
+        try:
+            return self.lookup(table_name, field, query)
+        except TypeError:
+            pass
+
         matches = []
         for member in getattr(self, table_name):
             if member[field] == query:
                 matches.append(member['token'])
         return matches
 
+    def __make_sample_chains__(self) -> None:
+        """ Precomputes the temporally ordered sample tokens of each scene. """
+        self._scene_samples = dict()
+        for scene_record in self.scene:
+            sample_tokens = []
+            sample_token = scene_record['first_sample_token']
+            while sample_token != '':
+                sample_tokens.append(sample_token)
+                sample_token = self.get('sample', sample_token)['next']
+            self._scene_samples[scene_record['token']] = sample_tokens
+
+    def __make_sample_data_chains__(self) -> None:
+        """
+        Precomputes the temporally ordered sample_data of each sensor by following the prev/next links once.
+        Every linked list of sample_data is stored as an array of row indices, together with the position of each
+        sample_data in its list. Each list is further split into the segments of each (scene, channel).
+        """
+        if isinstance(self.sample_data, ArrayTable):
+            prev_inds = self.sample_data.column('prev')
+            next_inds = self.sample_data.column('next')
+            sample_inds = self.sample_data.column('sample_token')
+            timestamps = self.sample_data.column('timestamp').astype(np.int64)
+            channels = self.sample_data.column('channel')
+        else:
+            prev_inds = np.array([-1 if r['prev'] == '' else self.getind('sample_data', r['prev'])
+                                  for r in self.sample_data], dtype=np.int64)
+            next_inds = np.array([-1 if r['next'] == '' else self.getind('sample_data', r['next'])
+                                  for r in self.sample_data], dtype=np.int64)
+            sample_inds = np.array([self.getind('sample', r['sample_token']) for r in self.sample_data],
+                                   dtype=np.int64)
+            timestamps = np.array([r['timestamp'] for r in self.sample_data], dtype=np.int64)
+            channels = [r['channel'] for r in self.sample_data]
+        sample_scenes = np.array([self.getind('scene', r['scene_token']) for r in self.sample], dtype=np.int64)
+        sd_scenes = sample_scenes[sample_inds] if len(sample_inds) > 0 else sample_inds
+
+        chains = []
+        chain_ids = np.full(len(next_inds), -1, dtype=np.int32)
+        chain_pos = np.full(len(next_inds), -1, dtype=np.int32)
+        segments = dict()
+        next_list = next_inds.tolist()
+        for head in np.flatnonzero(prev_inds == -1).tolist():
+            rows = []
+            ind = head
+            while ind != -1:
+                rows.append(ind)
+                ind = next_list[ind]
+            rows = np.array(rows, dtype=np.int64)
+            chain_ids[rows] = len(chains)
+            chain_pos[rows] = np.arange(len(rows))
+
+            # Split the chain wherever it enters a new scene.
+            chain_scenes = sd_scenes[rows]
+            bounds = [0] + (np.flatnonzero(np.diff(chain_scenes)) + 1).tolist() + [len(rows)]
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                key = (self.scene[chain_scenes[start]]['token'], channels[rows[start]])
+                segments[key] = (len(chains), start, stop)
+            chains.append(rows)
+
+        self._sd_chains = {
+            'chains': chains,
+            'chain_ids': chain_ids,
+            'chain_pos': chain_pos,
+            'timestamps': timestamps,
+            'segments': segments
+        }
+
+    def __sample_data_tokens__(self, rows: np.ndarray) -> List[str]:
+        """
+        Returns the tokens of sample_data rows.
+        :param rows: <np.int: n>. Row indices in the sample_data table.
+        :return: The n tokens.
+        """
+        return [self.sample_data[ind]['token'] for ind in rows.tolist()]
+
+    def __sample_data_chain__(self, sample_data_token: str) -> Tuple[np.ndarray, int]:
+        """
+        Returns the linked list of sample_data that a sample_data belongs to and its position therein.
+        :param sample_data_token: Unique sample_data identifier.
+        :return: (rows <np.int: n>, position). The row indices of the list in temporal order and the position.
+        """
+        if self._sd_chains is None:
+            self.__make_sample_data_chains__()
+        ind = self.getind('sample_data', sample_data_token)
+        chain = self._sd_chains['chains'][self._sd_chains['chain_ids'][ind]]
+        return chain, int(self._sd_chains['chain_pos'][ind])
+
+    def get_scene_samples(self, scene_token: str) -> List[str]:
+        """
+        Returns the tokens of all samples of a scene in temporal order.
+        The order of all scenes is precomputed on the first call.
+        :param scene_token: Unique scene identifier.
+        :return: List of sample tokens.
+        """
+        if self._scene_samples is None:
+            self.__make_sample_chains__()
+        return list(self._scene_samples[scene_token])
+
+    def get_scene_sample_data(self, scene_token: str, channel: str) -> Tuple[List[str], np.ndarray]:
+        """
+        Returns all sample_data (keyframes and sweeps) of a channel in a scene in temporal order.
+        The order of all sample_data is precomputed on the first call.
+        :param scene_token: Unique scene identifier.
+        :param channel: Sensor channel, e.g. 'LIDAR_TOP'.
+        :return: (tokens, timestamps <np.int64: n>). The sample_data tokens and their timestamps in micro-seconds.
+        """
+        if self._sd_chains is None:
+            self.__make_sample_data_chains__()
+        if (scene_token, channel) not in self._sd_chains['segments']:
+            return [], np.zeros(0, dtype=np.int64)
+
+        chain_id, start, stop = self._sd_chains['segments'][(scene_token, channel)]
+        rows = self._sd_chains['chains'][chain_id][start:stop]
+        return self.__sample_data_tokens__(rows), self._sd_chains['timestamps'][rows]
+
+    def get_sample_data_from(self, sample_data_token: str) -> List[str]:
+        """
+        Returns a sample_data and all following sample_data of the same sensor in temporal order.
+        This is equivalent to following the 'next' links until the end.
+        :param sample_data_token: Unique sample_data identifier.
+        :return: List of sample_data tokens, starting with sample_data_token.
+        """
+        chain, pos = self.__sample_data_chain__(sample_data_token)
+        return self.__sample_data_tokens__(chain[pos:])
+
+    def get_sweeps(self, sample_data_token: str, nsweeps: int) -> List[str]:
+        """
+        Returns a sample_data and up to nsweeps - 1 preceding sweeps of the same sensor, newest first.
+        This is equivalent to following the 'prev' links nsweeps - 1 times, but runs in O(nsweeps).
+        :param sample_data_token: Unique sample_data identifier.
+        :param nsweeps: Maximum number of sample_data to return.
+        :return: List of sample_data tokens, starting with sample_data_token.
+        """
+        chain, pos = self.__sample_data_chain__(sample_data_token)
+        return self.__sample_data_tokens__(chain[max(0, pos - nsweeps + 1):pos + 1][::-1])
+
+    def __timestamp_index__(self, channel: str, scene_token: str=None, log_token: str=None) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the timestamp index of a channel within a scene, a log or the whole database.
+        Each index is created on first use.
+        :param channel: Sensor channel, e.g. 'LIDAR_TOP'.
+        :param scene_token: Optional scene token to restrict the index to.
+        :param log_token: Optional log token to restrict the index to.
+        :return: (timestamps <np.int64: n>, rows <np.int: n>). The sorted timestamps and their sample_data rows.
+        """
+        assert scene_token is None or log_token is None, 'Error: Cannot restrict to both a scene and a log!'
+        if scene_token is not None:
+            key = ('scene', scene_token, channel)
+        elif log_token is not None:
+            key = ('log', log_token, channel)
+        else:
+            key = (None, None, channel)
+
+        if key not in self._timestamp_index:
+            if self._sd_chains is None:
+                self.__make_sample_data_chains__()
+            if scene_token is not None:
+                scene_tokens = [scene_token]
+            elif log_token is not None:
+                scene_tokens = [r['token'] for r in self.scene if r['log_token'] == log_token]
+            else:
+                scene_tokens = [r['token'] for r in self.scene]
+
+            segments = []
+            for token in scene_tokens:
+                if (token, channel) in self._sd_chains['segments']:
+                    chain_id, start, stop = self._sd_chains['segments'][(token, channel)]
+                    segments.append(self._sd_chains['chains'][chain_id][start:stop])
+            rows = np.concatenate(segments) if len(segments) > 0 else np.zeros(0, dtype=np.int64)
+            timestamps = self._sd_chains['timestamps'][rows]
+            order = np.argsort(timestamps, kind='mergesort')
+            self._timestamp_index[key] = (timestamps[order], rows[order])
+
+        return self._timestamp_index[key]
+
+    def nearest_sample_data(self, channel: str, timestamp: int, scene_token: str=None, log_token: str=None,
+                            direction: str='nearest') -> str:
+        """
+        Returns the sample_data of a channel that is closest in time to a timestamp, in O(log n).
+        :param channel: Sensor channel, e.g. 'LIDAR_TOP'.
+        :param timestamp: Timestamp in micro-seconds.
+        :param scene_token: Optional scene token to restrict the search to.
+        :param log_token: Optional log token to restrict the search to.
+        :param direction: 'nearest' for the closest sample_data, 'before' for the last sample_data at or before the
+            timestamp and 'after' for the first sample_data at or after the timestamp.
+        :return: The sample_data token or '' if there is no matching sample_data.
+        """
+        if direction not in ['nearest', 'before', 'after']:
+            raise ValueError('Invalid direction: {}'.format(direction))
+        timestamps, rows = self.__timestamp_index__(channel, scene_token=scene_token, log_token=log_token)
+
+        after = int(np.searchsorted(timestamps, timestamp, side='left'))
+        before = int(np.searchsorted(timestamps, timestamp, side='right')) - 1
+        if direction == 'after':
+            ind = after if after < len(timestamps) else -1
+        elif direction == 'before':
+            ind = before
+        elif after == len(timestamps):
+            ind = before
+        elif before == -1:
+            ind = after
+        else:
+            # Ties are resolved towards the earlier sample_data.
+            ind = before if timestamp - timestamps[before] <= timestamps[after] - timestamp else after
+
+        if ind == -1:
+            return ''
+        return self.sample_data[int(rows[ind])]['token']
+
+    def sample_data_in_window(self, channel: str, t0: int, t1: int, scene_token: str=None, log_token: str=None) \
+            -> List[str]:
+        """
+        Returns all sample_data of a channel with t0 <= timestamp <= t1 in temporal order, in O(log n + k).
+        :param channel: Sensor channel, e.g. 'LIDAR_TOP'.
+        :param t0: Start of the window in micro-seconds.
+        :param t1: End of the window in micro-seconds.
+        :param scene_token: Optional scene token to restrict the search to.
+        :param log_token: Optional log token to restrict the search to.
+        :return: List of sample_data tokens.
+        """
+        timestamps, rows = self.__timestamp_index__(channel, scene_token=scene_token, log_token=log_token)
+        start = np.searchsorted(timestamps, t0, side='left')
+        stop = np.searchsorted(timestamps, t1, side='right')
+        return self.__sample_data_tokens__(rows[start:stop])
+
+    def __make_transforms__(self, table_name: str) -> None:
+        """
+        Precomputes the rotation matrices and translations of all records of a table in a single vectorized pass.
+        :param table_name: Table name, either 'ego_pose' or 'calibrated_sensor'.
+        """
+        table = getattr(self, table_name)
+        if isinstance(table, ArrayTable):
+            rotations = table.column('rotation')
+            translations = table.column('translation')
+        else:
+            rotations = [r['rotation'] for r in table]
+            translations = [r['translation'] for r in table]
+        self._transforms[table_name] = (quaternions_to_rotation_matrices(rotations),
+                                        np.array(translations, dtype=np.float64).reshape(-1, 3))
+
+    def transform(self, table_name: str, token: str, inverse: bool=False) -> np.ndarray:
+        """
+        Returns the homogeneous transformation matrix of an ego_pose or calibrated_sensor record.
+        The matrices of all records of a table are precomputed on the first call.
+        This equals transform_matrix(record['translation'], Quaternion(record['rotation']), inverse=inverse).
+        :param table_name: Table name, either 'ego_pose' (ego vehicle to global frame) or 'calibrated_sensor' (sensor
+            to ego vehicle frame).
+        :param token: Token of the record.
+        :param inverse: Whether to return the inverse transformation.
+        :return: <np.float: 4, 4>. Transformation matrix.
+        """
+        if table_name not in ['ego_pose', 'calibrated_sensor']:
+            raise ValueError('Invalid table for transform: {}'.format(table_name))
+        if table_name not in self._transforms:
+            self.__make_transforms__(table_name)
+
+        ind = self.getind(table_name, token)
+        rotations, translations = self._transforms[table_name]
+        tm = np.eye(4)
+        if inverse:
+            tm[:3, :3] = rotations[ind].T
+            tm[:3, 3] = rotations[ind].T.dot(-translations[ind])
+        else:
+            tm[:3, :3] = rotations[ind]
+            tm[:3, 3] = translations[ind]
+        return tm
+
+    def sensor_to_global(self, sample_data_token: str, inverse: bool=False) -> np.ndarray:
+        """
+        Returns the transformation from the sensor frame of a sample_data to the global frame.
+        :param sample_data_token: Unique sample_data identifier.
+        :param inverse: Whether to return the transformation from the global frame to the sensor frame instead.
+        :return: <np.float: 4, 4>. Transformation matrix.
+        """
+        sd_record = self.get('sample_data', sample_data_token)
+        if inverse:
+            sensor_from_car = self.transform('calibrated_sensor', sd_record['calibrated_sensor_token'], inverse=True)
+            car_from_global = self.transform('ego_pose', sd_record['ego_pose_token'], inverse=True)
+            return np.dot(sensor_from_car, car_from_global)
+
+        global_from_car = self.transform('ego_pose', sd_record['ego_pose_token'])
+        car_from_sensor = self.transform('calibrated_sensor', sd_record['calibrated_sensor_token'])
+        return np.dot(global_from_car, car_from_sensor)
+
+    def sensor_to_sensor(self, sample_data_token_a: str, sample_data_token_b: str) -> np.ndarray:
+        """
+        Returns the transformation from the sensor frame of one sample_data to the sensor frame of another, via the
+        global frame. This accounts for the ego motion between the timestamps of both sample_data.
+        :param sample_data_token_a: Unique identifier of the source sample_data.
+        :param sample_data_token_b: Unique identifier of the target sample_data.
+        :return: <np.float: 4, 4>. Transformation matrix.
+        """
+        sd_a = self.get('sample_data', sample_data_token_a)
+        sd_b = self.get('sample_data', sample_data_token_b)
+        b_from_car = self.transform('calibrated_sensor', sd_b['calibrated_sensor_token'], inverse=True)
+        car_from_global = self.transform('ego_pose', sd_b['ego_pose_token'], inverse=True)
+        global_from_car = self.transform('ego_pose', sd_a['ego_pose_token'])
+        car_from_a = self.transform('calibrated_sensor', sd_a['calibrated_sensor_token'])
+        return np.dot(np.dot(np.dot(b_from_car, car_from_global), global_from_car), car_from_a)
+
+    def project_pointcloud(self, pointsensor_token: str, camera_tokens: List[str], pc: PointCloud=None,
+                           load_images: bool=False) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Image.Image]]:
+        """
+        Projects the point cloud of a point sensor into several cameras at once. The point cloud is loaded once and
+        for every camera the transformation to its frame and its intrinsics are fused into a single 3 x 4 matrix, so
+        that all cameras are projected with one matrix multiplication.
+        :param pointsensor_token: Lidar/radar sample_data token.
+        :param camera_tokens: Camera sample_data tokens.
+        :param pc: The point cloud in the point sensor frame, e.g. from from_file_multisweep(). Loaded from the
+            pointsensor file if None.
+        :param load_images: Whether to also open the camera images.
+        :return: (points <np.float: c, 2, n>, depths <np.float: c, n>, masks <np.bool: c, n>, images [<Image>]).
+            The pixel coordinates and depths of all n points in each of the c cameras, the masks of the points that
+            lie in front of each camera and inside its image (with a margin of 1 pixel), and the images if load_images
+            is True, else None.
+        """
+        if pc is None:
+            pointsensor = self.get('sample_data', pointsensor_token)
+            pcl_path = osp.join(self.dataroot, pointsensor['filename'])
+            if pointsensor['sensor_modality'] == 'lidar':
+                pc = LidarPointCloud.from_file(pcl_path)
+            else:
+                pc = RadarPointCloud.from_file(pcl_path)
+
+        # Fuse the transformation into each camera frame and the camera intrinsics.
+        cams = [self.get('sample_data', camera_token) for camera_token in camera_tokens]
+        projections = np.empty((len(cams), 3, 4))
+        for i, (camera_token, cam) in enumerate(zip(camera_tokens, cams)):
+            cs_record = self.get('calibrated_sensor', cam['calibrated_sensor_token'])
+            cam_from_pointsensor = self.sensor_to_sensor(pointsensor_token, camera_token)
+            projections[i] = np.dot(np.array(cs_record['camera_intrinsic']), cam_from_pointsensor[:3, :])
+
+        # Project into all cameras at once and renormalize. The depth is the camera frame z axis.
+        projected = np.dot(projections[:, :, :3].reshape(-1, 3), pc.points[:3, :]) + projections[:, :, 3].reshape(-1, 1)
+        projected = projected.reshape(len(cams), 3, pc.nbr_points())
+        depths = projected[:, 2, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            points = projected[:, :2, :] / depths[:, None, :]
+
+        # Keep the points that are in front of the camera and inside the image.
+        sizes = np.array([[cam['width'], cam['height']] for cam in cams], dtype=np.float64).reshape(-1, 2, 1)
+        masks = np.logical_and(depths > 0, np.all(np.logical_and(points > 1, points < sizes - 1), axis=1))
+
+        images = [Image.open(osp.join(self.dataroot, cam['filename'])) for cam in cams] if load_images else None
+        return points, depths, masks, images
+
     def get_sample_data_path(self, sample_data_token: str) -> str:
         """ Returns the path to a sample_data. """
 
@@ -225,17 +1410,23 @@ class NuScenes:
         else:
             boxes = self.get_boxes(sample_data_token)
 
+        # The inverse rotations and translations are the same for all boxes.
+        pose_translation = -np.array(pose_record['translation'])
+        pose_rotation = Quaternion(pose_record['rotation']).inverse
+        cs_translation = -np.array(cs_record['translation'])
+        cs_rotation = Quaternion(cs_record['rotation']).inverse
+
         # Make list of Box objects including coord system transforms.
         box_list = []
         for box in boxes:
 
             # Move box to ego vehicle coord system
-            box.translate(-np.array(pose_record['translation']))
-            box.rotate(Quaternion(pose_record['rotation']).inverse)
+            box.translate(pose_translation)
+            box.rotate(pose_rotation)
 
             #  Move box to sensor coord system
-            box.translate(-np.array(cs_record['translation']))
-            box.rotate(Quaternion(cs_record['rotation']).inverse)
+            box.translate(cs_translation)
+            box.rotate(cs_rotation)
 
             if sensor_record['modality'] == 'camera' and not \
                     box_in_image(box, cam_intrinsic, imsize, vis_level=box_vis_level):
@@ -391,11 +1582,13 @@ class NuScenes:
         self.explorer.render_instance(instance_token)
 
     def render_scene(self, scene_token: str, freq: float=10, imsize: Tuple[float, float]=(640, 360),
-                     out_path: str=None) -> None:
-        self.explorer.render_scene(scene_token, freq, imsize, out_path)
+                     out_path: str=None, headless: bool=False) -> None:
+        self.explorer.render_scene(scene_token, freq, imsize, out_path, headless)
 
-    def render_scene_channel(self, scene_token: str, channel: str='CAM_FRONT', imsize: Tuple[float, float]=(640, 360)):
-        self.explorer.render_scene_channel(scene_token, channel=channel, imsize=imsize)
+    def render_scene_channel(self, scene_token: str, channel: str='CAM_FRONT', imsize: Tuple[float, float]=(640, 360),
+                             out_path: str=None, headless: bool=False):
+        self.explorer.render_scene_channel(scene_token, channel=channel, imsize=imsize, out_path=out_path,
+                                           headless=headless)
 
     def render_egoposes_on_map(self, log_location: str, scene_tokens: List=None, demo_ss_factor: float=2.0) -> None:
         self.explorer.render_egoposes_on_map(log_location, scene_tokens, demo_ss_factor)
@@ -475,12 +1668,9 @@ class NuScenesExplorer:
         """ Lists all scenes with some meta data. """
 
         def ann_count(record):
-            count = 0
-            sample = self.nusc.get('sample', record['first_sample_token'])
-            while not sample['next'] == "":
-                count += len(sample['anns'])
-                sample = self.nusc.get('sample', sample['next'])
-            return count
+            # Note that the annotations of the last sample are not counted.
+            sample_tokens = self.nusc.get_scene_samples(record['token'])
+            return sum(len(self.nusc.get('sample', token)['anns']) for token in sample_tokens[:-1])
 
         recs = [(self.nusc.get('sample', record['first_sample_token'])['timestamp'], record) for record in
                 self.nusc.scene]
@@ -520,55 +1710,17 @@ class NuScenesExplorer:
         :return (pointcloud <np.float: 2, n)>, coloring <np.float: n>, image <Image>).
         """
 
-        cam = self.nusc.get('sample_data', camera_token)
-        pointsensor = self.nusc.get('sample_data', pointsensor_token)
-        pcl_path = osp.join(self.nusc.dataroot, pointsensor['filename'])
-        if pointsensor['sensor_modality'] == 'lidar':
-            pc = LidarPointCloud.from_file(pcl_path)
-        else:
-            pc = RadarPointCloud.from_file(pcl_path)
-        im = Image.open(osp.join(self.nusc.dataroot, cam['filename']))
-
         # Points live in the point sensor frame. So they need to be transformed via global to the image plane.
-        # First step: transform the point-cloud to the ego vehicle frame for the timestamp of the sweep.
-        cs_record = self.nusc.get('calibrated_sensor', pointsensor['calibrated_sensor_token'])
-        pc.rotate(Quaternion(cs_record['rotation']).rotation_matrix)
-        pc.translate(np.array(cs_record['translation']))
-
-        # Second step: transform to the global frame.
-        poserecord = self.nusc.get('ego_pose', pointsensor['ego_pose_token'])
-        pc.rotate(Quaternion(poserecord['rotation']).rotation_matrix)
-        pc.translate(np.array(poserecord['translation']))
-
-        # Third step: transform into the ego vehicle frame for the timestamp of the image.
-        poserecord = self.nusc.get('ego_pose', cam['ego_pose_token'])
-        pc.translate(-np.array(poserecord['translation']))
-        pc.rotate(Quaternion(poserecord['rotation']).rotation_matrix.T)
-
-        # Fourth step: transform into the camera.
-        cs_record = self.nusc.get('calibrated_sensor', cam['calibrated_sensor_token'])
-        pc.translate(-np.array(cs_record['translation']))
-        pc.rotate(Quaternion(cs_record['rotation']).rotation_matrix.T)
-
-        # Fifth step: actually take a "picture" of the point cloud.
-        # Grab the depths (camera frame z axis points away from the camera).
-        depths = pc.points[2, :]
-
-        # Set the height to be the coloring.
-        coloring = pc.points[2, :]
-
-        # Take the actual picture (matrix multiplication with camera-matrix + renormalization).
-        points = view_points(pc.points[:3, :], np.array(cs_record['camera_intrinsic']), normalize=True)
-
-        # Remove points that are either outside or behind the camera. Leave a margin of 1 pixel for aesthetic reasons.
-        mask = np.ones(depths.shape[0], dtype=bool)
-        mask = np.logical_and(mask, depths > 0)
-        mask = np.logical_and(mask, points[0, :] > 1)
-        mask = np.logical_and(mask, points[0, :] < im.size[0] - 1)
-        mask = np.logical_and(mask, points[1, :] > 1)
-        mask = np.logical_and(mask, points[1, :] < im.size[1] - 1)
-        points = points[:, mask]
-        coloring = coloring[mask]
+        # The four steps (to the ego vehicle frame for the timestamp of the sweep, to the global frame, to the ego
+        # vehicle frame for the timestamp of the image and into the camera) and taking the "picture" with the camera
+        # matrix are fused into one projection.
+        points, depths, masks, images = self.nusc.project_pointcloud(pointsensor_token, [camera_token],
+                                                                     load_images=True)
+        mask, im = masks[0], images[0]
+
+        # Remove points that are either outside or behind the camera and set the depth to be the coloring.
+        points = np.vstack((points[0][:, mask], np.ones((1, np.count_nonzero(mask)))))
+        coloring = depths[0][mask]
 
         return points, coloring, im
 
@@ -841,16 +1993,20 @@ class NuScenesExplorer:
         self.render_annotation(closest[1])
 
     def render_scene(self, scene_token: str, freq: float=10, imsize: Tuple[float, float]=(640, 360),
-                     out_path: str=None) -> None:
+                     out_path: str=None, headless: bool=False) -> None:
         """
         Renders a full scene with all camera channels.
         :param scene_token: Unique identifier of scene to render.
         :param freq: Display frequency (Hz).
         :param imsize: Size of image to render. The larger the slower this will run.
-        :param out_path: Optional path to write a video file of the rendered frames.
+        :param out_path: Optional path to write a video file of the rendered frames, or a directory (without file
+            extension) to write them as numbered images (see FrameWriter).
+        :param headless: Whether to only write the frames to out_path without opening a window. This does not need a
+            display and renders as fast as possible.
         """
 
         assert imsize[0] / imsize[1] == 16 / 9, "Aspect ratio should be 16/9."
+        assert out_path is not None or not headless, 'Error: Headless rendering requires an out_path!'
 
         # Get records from DB.
         scene_rec = self.nusc.get('scene', scene_token)
@@ -872,22 +2028,24 @@ class NuScenesExplorer:
         time_step = 1 / freq * 1e6  # Time-stamps are measured in micro-seconds.
 
         window_name = '{}'.format(scene_rec['name'])
-        cv2.namedWindow(window_name)
-        cv2.moveWindow(window_name, 0, 0)
+        if not headless:
+            cv2.namedWindow(window_name)
+            cv2.moveWindow(window_name, 0, 0)
 
         canvas = np.ones((2 * imsize[1], 3 * imsize[0], 3), np.uint8)
         if out_path is not None:
-            fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-            out = cv2.VideoWriter(out_path, fourcc, freq, canvas.shape[1::-1])
+            out = FrameWriter(out_path, freq, canvas.shape[1::-1])
         else:
             out = None
 
         # Load first sample_data record for each channel
         current_recs = {}  # Holds the current record to be displayed by channel.
         prev_recs = {}  # Hold the previous displayed record by channel.
+        last_tokens = {}  # Holds the last record of the scene by channel.
         for channel in layout:
             current_recs[channel] = self.nusc.get('sample_data', first_sample_rec['data'][channel])
             prev_recs[channel] = None
+            last_tokens[channel] = self.nusc.get_scene_sample_data(scene_token, channel)[0][-1]
 
         current_time = first_sample_rec['timestamp']
 
@@ -895,11 +2053,11 @@ class NuScenesExplorer:
 
             current_time += time_step
 
-            # For each channel, find first sample that has time > current_time.
-            for channel, sd_rec in current_recs.items():
-                while sd_rec['timestamp'] < current_time and sd_rec['next'] != '':
-                    sd_rec = self.nusc.get('sample_data', sd_rec['next'])
-                    current_recs[channel] = sd_rec
+            # For each channel, find first sample that has time >= current_time using the timestamp index.
+            for channel in current_recs:
+                sd_token = self.nusc.nearest_sample_data(channel, current_time, scene_token=scene_token,
+                                                         direction='after')
+                current_recs[channel] = self.nusc.get('sample_data', sd_token or last_tokens[channel])
 
             # Now add to canvas
             for channel, sd_rec in current_recs.items():
@@ -929,9 +2087,11 @@ class NuScenesExplorer:
                     prev_recs[channel] = sd_rec  # Store here so we don't render the same image twice.
 
             # Show updated canvas.
-            cv2.imshow(window_name, canvas)
             if out_path is not None:
                 out.write(canvas)
+            if headless:
+                continue
+            cv2.imshow(window_name, canvas)
 
             key = cv2.waitKey(1)  # Wait a very short time (1 ms).
 
@@ -942,16 +2102,21 @@ class NuScenesExplorer:
                 cv2.destroyAllWindows()
                 break
 
-        cv2.destroyAllWindows()
+        if not headless:
+            cv2.destroyAllWindows()
         if out_path is not None:
             out.release()
 
-    def render_scene_channel(self, scene_token: str, channel: str='CAM_FRONT', imsize: Tuple[float, float]=(640, 360)):
+    def render_scene_channel(self, scene_token: str, channel: str='CAM_FRONT', imsize: Tuple[float, float]=(640, 360),
+                             out_path: str=None, headless: bool=False):
         """
         Renders a full scene for a particular camera channel.
         :param scene_token: Unique identifier of scene to render.
         :param channel: Channel to render.
         :param imsize: Size of image to render. The larger the slower this will run.
+        :param out_path: Optional path to write a video file (at 10 Hz) of the rendered frames, or a directory (without
+            file extension) to write them as numbered images (see FrameWriter).
+        :param headless: Whether to only write the frames to out_path without opening a window.
         :return:
         """
 
@@ -960,23 +2125,24 @@ class NuScenesExplorer:
 
         assert imsize[0] / imsize[1] == 16 / 9, "Aspect ratio should be 16/9."
         assert channel in valid_channels, 'Input channel {} not valid.'.format(channel)
+        assert out_path is not None or not headless, 'Error: Headless rendering requires an out_path!'
 
         # Get records from DB
         scene_rec = self.nusc.get('scene', scene_token)
         sample_rec = self.nusc.get('sample', scene_rec['first_sample_token'])
-        sd_rec = self.nusc.get('sample_data', sample_rec['data'][channel])
+        sd_tokens = self.nusc.get_sample_data_from(sample_rec['data'][channel])
 
         # Open CV init
         name = '{}: {} (Space to pause, ESC to exit)'.format(scene_rec['name'], channel)
-        cv2.namedWindow(name)
-        cv2.moveWindow(name, 0, 0)
+        if not headless:
+            cv2.namedWindow(name)
+            cv2.moveWindow(name, 0, 0)
+        out = FrameWriter(out_path, 10, imsize) if out_path is not None else None
 
-        has_more_frames = True
-        while has_more_frames:
+        for sd_token in sd_tokens:
 
             # Get data from DB
-            impath, boxes, camera_intrinsic = self.nusc.get_sample_data(sd_rec['token'],
-                                                                        box_vis_level=BoxVisibility.ANY)
+            impath, boxes, camera_intrinsic = self.nusc.get_sample_data(sd_token, box_vis_level=BoxVisibility.ANY)
 
             # Load and render
             if not osp.exists(impath):
@@ -988,6 +2154,10 @@ class NuScenesExplorer:
 
             # Render
             im = cv2.resize(im, imsize)
+            if out is not None:
+                out.write(im)
+            if headless:
+                continue
             cv2.imshow(name, im)
 
             key = cv2.waitKey(10)  # Images stored at approx 10 Hz, so wait 10 ms.
@@ -998,12 +2168,10 @@ class NuScenesExplorer:
                 cv2.destroyAllWindows()
                 break
 
-            if not sd_rec['next'] == "":
-                sd_rec = self.nusc.get('sample_data', sd_rec['next'])
-            else:
-                has_more_frames = False
-
-        cv2.destroyAllWindows()
+        if not headless:
+            cv2.destroyAllWindows()
+        if out is not None:
+            out.release()
 
     def render_egoposes_on_map(self, log_location: str, scene_tokens: List=None, demo_ss_factor: float=2.0) \
             -> None:
@@ -1085,21 +2253,10 @@ class NuScenesExplorer:
         :param start_token: The start sample token.
         :return: <list>. All sample token.
         """
-        
-        tmp_sample = self.nusc.get('sample', start_sample_token)
-        sample_list = []
-        
-        has_more_frames = True
-        while has_more_frames:
-
-            sample_list.append(tmp_sample['token'])
 
-            if not tmp_sample['next'] == "":
-                tmp_sample = self.nusc.get('sample',tmp_sample['next'])
-            else:
-                has_more_frames = False
-                
-        return sample_list
+        scene_token = self.nusc.get('sample', start_sample_token)['scene_token']
+        sample_list = self.nusc.get_scene_samples(scene_token)
+        return sample_list[sample_list.index(start_sample_token):]
 
     def save_sample_data(self, start_sample_token: str, channel: str='RADAR_FRONT', with_anns: bool=True,
                            box_vis_level: BoxVisibility=BoxVisibility.ANY, axes_limit: float=40, ax: Axes=None,
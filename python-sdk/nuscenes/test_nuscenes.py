@@ -0,0 +1,90 @@
+# nuScenes dev-kit.
+# Licensed under the Creative Commons [see licence.txt]
+
+import multiprocessing
+import tempfile
+import tracemalloc
+import unittest
+from typing import Dict, List
+
+from nuscenes.nuscenes import NuScenes
+from nuscenes.utils.testing import write_test_db
+
+
+def measure_get(handle: dict, tokens: Dict[str, List[str]]) -> int:
+    """
+    Attaches to the shared tables in a worker process and looks up every token twice.
+    :param handle: The handle returned by NuScenes.share_memory().
+    :param tokens: The tokens to look up by table name.
+    :return: The number of bytes that are still allocated after the second round of lookups.
+    """
+    nusc = NuScenes.attach_shared_memory(handle)
+    try:
+        tracemalloc.start()
+        for _ in range(2):
+            for table_name, table_tokens in tokens.items():
+                for token in table_tokens:
+                    assert nusc.get(table_name, token)['token'] == token
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return current
+    finally:
+        nusc._shared_memory.close()
+
+
+class TestSharedMemory(unittest.TestCase):
+    def test_attach(self):
+        """Test that looking up records in a worker that attached to the shared tables allocates no memory."""
+        with tempfile.TemporaryDirectory() as dataroot:
+            write_test_db(dataroot, nbr_scenes_per_log=4)
+            nusc = NuScenes(dataroot=dataroot, verbose=False, table_backend='array', compact_tokens=True)
+            handle = nusc.share_memory()
+            try:
+                tokens = {table_name: [record['token'] for record in getattr(nusc, table_name)]
+                          for table_name in ['sample_data', 'sample_annotation', 'ego_pose']}
+                with multiprocessing.get_context('spawn').Pool(1) as pool:
+                    allocated = pool.apply(measure_get, (handle, tokens))
+
+                # A dict of the tokens of these tables would take more than 20kB.
+                self.assertLess(allocated, 1000)
+            finally:
+                nusc.release_shared_memory()
+
+    def test_release(self):
+        """Test that the tables can be shared again after releasing them, and that they stay usable."""
+        with tempfile.TemporaryDirectory() as dataroot:
+            write_test_db(dataroot)
+            nusc = NuScenes(dataroot=dataroot, verbose=False, table_backend='array', compact_tokens=True)
+            records = [dict(record) for record in nusc.sample_data]
+            for _ in range(2):
+                handle = nusc.share_memory()
+                self.assertEqual(NuScenes.attach_shared_memory(handle).sample_data[0], records[0])
+                nusc.release_shared_memory()
+                self.assertIsNone(nusc._shared_memory)
+                self.assertEqual([dict(record) for record in nusc.sample_data], records)
+                self.assertEqual(nusc.get('sample_data', records[-1]['token']), records[-1])
+
+            # Releasing again does nothing.
+            nusc.release_shared_memory()
+
+
+class TestSubset(unittest.TestCase):
+    def test_cross_scene(self):
+        """Test that the prev and next links of a subset only refer to records of the subset."""
+        with tempfile.TemporaryDirectory() as dataroot:
+            write_test_db(dataroot, nbr_scenes_per_log=3)
+            scenes = ['scene-0001', 'scene-0003']
+            for table_backend in ['dict', 'array']:
+                nusc = NuScenes(dataroot=dataroot, verbose=False, table_backend=table_backend, compact_tokens=True,
+                                scenes=scenes)
+                self.assertEqual([scene['name'] for scene in nusc.scene], scenes)
+                for table_name in ['sample_data', 'sample_annotation']:
+                    for record in getattr(nusc, table_name):
+                        if record['prev'] != '':
+                            self.assertEqual(nusc.get(table_name, record['prev'])['next'], record['token'])
+                        if record['next'] != '':
+                            self.assertEqual(nusc.get(table_name, record['next'])['prev'], record['token'])
+
+                # Each sensor has one chain per selected scene, as the scenes are in different logs.
+                nbr_chains = sum(record['prev'] == '' for record in nusc.sample_data)
+                self.assertEqual(nbr_chains, 2 * len(scenes))
@@ -0,0 +1,370 @@
+# nuScenes dev-kit.
+# Licensed under the Creative Commons [see licence.txt]
+
+from __future__ import annotations
+from collections.abc import Mapping, Sequence
+from typing import Dict, List, Any
+
+import numpy as np
+
+
+class ArrayTable(Sequence):
+    """
+    Column-oriented storage of a database table. Every field is stored in a contiguous numpy array:
+    - Numbers and booleans are stored as int64, float64 or bool arrays.
+    - Fixed-length numeric lists (e.g. translation, rotation, size) are stored as float64 arrays of shape n x k.
+    - Strings are stored as integer codes into an array of unique utf-8 encoded values.
+    - Links to other records (e.g. prev, next, sample_token) are stored as int32 row indices into the linked table,
+      where -1 denotes an empty link. Lists of links (e.g. attribute_tokens) are stored in a flat array with offsets.
+    Indexing the table returns an ArrayRecord, a dict-like view of a row, so that code written against the list of
+    dicts keeps working. Vectorized code can access whole columns through column().
+    """
+
+    def __init__(self, records: List[Dict], links: Dict[str, str], token2ind: Dict[str, Mapping],
+                 tokens: Dict[str, np.ndarray], compact_tokens: bool=False):
+        """
+        Converts a list of records to columns.
+        :param records: The records of the table. All records must have the same fields.
+        :param links: Maps each link field to the name of the linked table.
+        :param token2ind: Maps each linked table name to its token to row index mapping (a dict or TokenIndex).
+        :param tokens: Maps each linked table name to its token array (see encode_tokens()). This dict is shared by
+            all tables of a database and is used to convert row indices back to tokens.
+        :param compact_tokens: Whether to store the tokens of this table as 128-bit binary values.
+        """
+        self.links = dict(links)
+        self.tokens = tokens
+        self.kinds = dict()
+        self.columns = dict()
+        self.nbr_rows = len(records)
+
+        fields = list(records[0].keys()) if self.nbr_rows > 0 else []
+        for field in fields:
+            values = [record[field] for record in records]
+            if field == 'token':
+                self.kinds[field] = 'token'
+                self.columns[field] = encode_tokens(values, compact=compact_tokens)
+            elif field in self.links:
+                target_ind = token2ind[self.links[field]]
+                if len(values) > 0 and isinstance(values[0], list):
+                    self.kinds[field] = 'link_list'
+                    lengths = np.array([len(v) for v in values], dtype=np.int64)
+                    self.columns[field + '.offsets'] = np.concatenate(([0], np.cumsum(lengths)))
+                    self.columns[field] = _tokens_to_inds(target_ind, [t for v in values for t in v])
+                else:
+                    self.kinds[field] = 'link'
+                    self.columns[field] = _tokens_to_inds(target_ind, values)
+            else:
+                self.set_column(field, values)
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray], kinds: Dict[str, str], links: Dict[str, str],
+                     tokens: Dict[str, np.ndarray], nbr_rows: int) -> ArrayTable:
+        """
+        Creates a table from the columns of another table without converting them, e.g. from columns in shared memory.
+        :param columns: The columns, as in ArrayTable.columns.
+        :param kinds: The kind of each field, as in ArrayTable.kinds.
+        :param links: Maps each link field to the name of the linked table.
+        :param tokens: Maps each linked table name to its token array.
+        :param nbr_rows: Number of rows.
+        :return: The table.
+        """
+        table = cls.__new__(cls)
+        table.links = dict(links)
+        table.tokens = tokens
+        table.kinds = dict(kinds)
+        table.columns = dict(columns)
+        table.nbr_rows = nbr_rows
+        return table
+
+    def set_column(self, field: str, values) -> None:
+        """
+        Adds or replaces a (non-link) column. The storage type is inferred from the values.
+        :param field: Field name.
+        :param values: List or array with one value per row.
+        """
+        assert len(values) == self.nbr_rows, 'Error: Expected %d values, got %d!' % (self.nbr_rows, len(values))
+
+        if isinstance(values, np.ndarray) and values.dtype.kind in 'biuf':
+            self.kinds[field] = 'scalar' if values.ndim == 1 else 'vector'
+            self.columns[field] = values
+            return
+
+        first = values[0] if self.nbr_rows > 0 else None
+        if all(type(v) == bool or isinstance(v, np.bool_) for v in values):
+            self.kinds[field] = 'scalar'
+            self.columns[field] = np.array(values, dtype=bool)
+        elif all(type(v) == int for v in values):
+            self.kinds[field] = 'scalar'
+            self.columns[field] = np.array(values, dtype=np.int64)
+        elif all(type(v) in (int, float) for v in values):
+            self.kinds[field] = 'scalar'
+            self.columns[field] = np.array(values, dtype=np.float64)
+        elif all(isinstance(v, str) for v in values):
+            self.kinds[field] = 'string'
+            uniques, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+            self.columns[field] = codes.astype(np.int32)
+            self.columns[field + '.values'] = np.array([u.encode('utf-8') for u in uniques], dtype=bytes)
+        elif isinstance(first, list) and all(isinstance(v, list) and len(v) == len(first) and
+                                             all(type(e) in (int, float) for e in v) for v in values):
+            self.kinds[field] = 'vector'
+            self.columns[field] = np.array(values, dtype=np.float64).reshape(self.nbr_rows, len(first))
+        else:
+            # Anything else (e.g. nested or variable-length lists) is kept as Python objects.
+            self.kinds[field] = 'object'
+            column = np.empty(self.nbr_rows, dtype=object)
+            column[:] = values
+            self.columns[field] = column
+
+    def column(self, field: str) -> np.ndarray:
+        """
+        Returns a whole column for vectorized access.
+        :param field: Field name.
+        :return: <np.array: n, ...>. Numbers as stored, links as row indices (-1 for empty links), strings and
+            tokens as an object array of str. For lists of links this returns the flat row indices of all rows, see
+            column_offsets().
+        """
+        kind = self.kinds[field]
+        if kind == 'string':
+            values = np.array([v.decode('utf-8') for v in self.columns[field + '.values']], dtype=object)
+            return values[self.columns[field]]
+        elif kind == 'token':
+            return np.array(decode_tokens(self.columns[field]), dtype=object)
+        else:
+            return self.columns[field]
+
+    def column_offsets(self, field: str) -> np.ndarray:
+        """
+        Returns the offsets of a list-of-links column. The links of row i are column(field)[offsets[i]:offsets[i+1]].
+        :param field: Field name.
+        :return: <np.int64: n + 1>. The offsets.
+        """
+        return self.columns[field + '.offsets']
+
+    def fields(self) -> List[str]:
+        """ Returns the field names of the table. """
+        return list(self.kinds.keys())
+
+    def value(self, ind: int, field: str) -> Any:
+        """
+        Returns a single value, converted to the same type as in the JSON table.
+        :param ind: Row index.
+        :param field: Field name.
+        :return: The value.
+        """
+        kind = self.kinds[field]
+        column = self.columns[field]
+        if kind == 'scalar':
+            return column[ind].item()
+        elif kind == 'vector':
+            return column[ind].tolist()
+        elif kind == 'string':
+            return self.columns[field + '.values'][column[ind]].decode('utf-8')
+        elif kind == 'token':
+            return decode_tokens(column[ind:ind + 1])[0]
+        elif kind == 'link':
+            target_ind = column[ind]
+            if target_ind == -1:
+                return ''
+            target_tokens = self.tokens[self.links[field]]
+            return decode_tokens(target_tokens[target_ind:target_ind + 1])[0]
+        elif kind == 'link_list':
+            offsets = self.columns[field + '.offsets']
+            target_inds = column[offsets[ind]:offsets[ind + 1]]
+            return decode_tokens(self.tokens[self.links[field]][target_inds])
+        else:
+            return column[ind]
+
+    def __len__(self) -> int:
+        return self.nbr_rows
+
+    def __getitem__(self, ind):
+        if isinstance(ind, slice):
+            return [ArrayRecord(self, i) for i in range(*ind.indices(self.nbr_rows))]
+
+        ind = int(ind)
+        if ind < 0:
+            ind += self.nbr_rows
+        if not 0 <= ind < self.nbr_rows:
+            raise IndexError('Table index out of range')
+        return ArrayRecord(self, ind)
+
+    def __iter__(self):
+        for ind in range(self.nbr_rows):
+            yield ArrayRecord(self, ind)
+
+
+class ArrayRecord(Mapping):
+    """
+    Read-only dict-like view of a row in an ArrayTable.
+    Every indexing of the table creates a new view, so values cannot be assigned to a record. Columns are added or
+    replaced for all rows at once with ArrayTable.set_column().
+    """
+
+    __slots__ = ['table', 'ind']
+
+    def __init__(self, table: ArrayTable, ind: int):
+        """
+        :param table: The table.
+        :param ind: Row index of the record.
+        """
+        self.table = table
+        self.ind = ind
+
+    def __getitem__(self, key: str):
+        if key not in self.table.kinds:
+            raise KeyError(key)
+        return self.table.value(self.ind, key)
+
+    def __setitem__(self, key: str, value) -> None:
+        raise TypeError('Cannot assign field {} of an array-backed record, use ArrayTable.set_column() '
+                        'instead'.format(key))
+
+    def __delitem__(self, key: str) -> None:
+        raise TypeError('Cannot delete field {} of an array-backed record'.format(key))
+
+    def __contains__(self, key) -> bool:
+        return key in self.table.kinds
+
+    def __iter__(self):
+        return iter(self.table.kinds)
+
+    def __len__(self) -> int:
+        return len(self.table.kinds)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ArrayRecord) and other.table is self.table and other.ind == self.ind:
+            return True
+        return super().__eq__(other)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def __reduce__(self):
+        # Pickle as a plain dict, rather than the whole table.
+        return dict, (dict(self),)
+
+
+class TokenIndex(Mapping):
+    """
+    Maps tokens to row indices like a dict. The index itself only consists of the 128-bit binary tokens in a sorted
+    array and their row indices, so that it can be stored in shared memory or in a cache file without a Python string
+    and dict entry per record. Tokens are looked up with a binary search, which allocates nothing, so that processes
+    that attach to the index in shared memory do not each build a private copy of it. A single lookup takes a few us,
+    which is slower than a dict. Many tokens are looked up at once with get_many().
+    """
+
+    def __init__(self, tokens: np.ndarray):
+        """
+        :param tokens: <np.void16: n>. Tokens in row order, as returned by encode_tokens(..., compact=True).
+        """
+        assert tokens.dtype == COMPACT_TOKEN_DTYPE, 'Error: TokenIndex requires compact tokens!'
+        sorted_keys = tokens.view('S16')
+        self.order = np.argsort(sorted_keys, kind='stable').astype(np.int32)
+        self.sorted_keys = sorted_keys[self.order]
+
+    @classmethod
+    def from_arrays(cls, sorted_keys: np.ndarray, order: np.ndarray) -> TokenIndex:
+        """
+        Creates an index from the arrays of another index without sorting, e.g. from arrays in shared memory.
+        :param sorted_keys: <np.bytes16: n>. The sorted keys, as in TokenIndex.sorted_keys.
+        :param order: <np.int32: n>. The row index of each key, as in TokenIndex.order.
+        :return: The index.
+        """
+        index = cls.__new__(cls)
+        index.sorted_keys = sorted_keys
+        index.order = order
+        return index
+
+    def get_many(self, tokens: List[str]) -> np.ndarray:
+        """
+        Looks up many tokens at once.
+        :param tokens: List of tokens.
+        :return: <np.int32: n>. The row index of each token, -1 for empty tokens.
+        """
+        empty = np.array([t == '' for t in tokens], dtype=bool)
+        if len(self.sorted_keys) == 0:
+            if not np.all(empty):
+                raise KeyError(tokens[int(np.argmin(empty))])
+            return -np.ones(len(tokens), dtype=np.int32)
+
+        query = encode_tokens([t if t != '' else '0' * 32 for t in tokens], compact=True)
+        if query.dtype != COMPACT_TOKEN_DTYPE:
+            raise KeyError('Invalid token in {}'.format([t for t in tokens if len(t) != 32][:1]))
+        query = query.view('S16')
+        pos = np.minimum(np.searchsorted(self.sorted_keys, query), len(self.sorted_keys) - 1)
+        found = np.logical_or(self.sorted_keys[pos] == query, empty)
+        if not np.all(found):
+            raise KeyError(decode_tokens(query.view(COMPACT_TOKEN_DTYPE)[~found][:1])[0])
+        inds = self.order[pos]
+        inds[empty] = -1
+        return inds
+
+    def __getitem__(self, token: str) -> int:
+        try:
+            key = bytes.fromhex(token)
+        except (TypeError, ValueError):
+            raise KeyError(token)
+        if len(key) != 16 or key.hex() != token or len(self.sorted_keys) == 0:
+            raise KeyError(token)
+
+        # Trailing null bytes are not part of the items of a bytes array.
+        pos = int(self.sorted_keys.searchsorted(key))
+        if pos < len(self.sorted_keys) and self.sorted_keys.item(pos) == key.rstrip(b'\x00'):
+            return self.order.item(pos)
+        raise KeyError(token)
+
+    def __iter__(self):
+        return iter(decode_tokens(self.sorted_keys.view(COMPACT_TOKEN_DTYPE)))
+
+    def __len__(self) -> int:
+        return len(self.sorted_keys)
+
+
+# 128-bit binary representation of a 32-character hex token.
+COMPACT_TOKEN_DTYPE = np.dtype('V16')
+
+
+def encode_tokens(tokens: List[str], compact: bool=False) -> np.ndarray:
+    """
+    Converts tokens to a fixed-width array.
+    :param tokens: List of tokens.
+    :param compact: Whether to store each token as 16 binary bytes. This falls back to the default encoding if any
+        token is not a lower-case 32-character hex string.
+    :return: <np.bytes: n> or <np.void16: n>. The encoded tokens.
+    """
+    if compact and all(len(t) == 32 for t in tokens):
+        joined = ''.join(tokens)
+        try:
+            binary = bytes.fromhex(joined)
+        except ValueError:
+            binary = None
+        if binary is not None and binary.hex() == joined:
+            return np.frombuffer(binary, dtype=COMPACT_TOKEN_DTYPE).copy()
+
+    return np.array([t.encode('utf-8') for t in tokens], dtype=bytes)
+
+
+def decode_tokens(tokens: np.ndarray) -> List[str]:
+    """
+    Converts a token array created by encode_tokens() back to strings.
+    :param tokens: <np.bytes: n> or <np.void16: n>. The encoded tokens.
+    :return: List of tokens.
+    """
+    if tokens.dtype == COMPACT_TOKEN_DTYPE:
+        joined = tokens.tobytes().hex()
+        return [joined[i:i + 32] for i in range(0, len(joined), 32)]
+
+    return [t.decode('utf-8') for t in tokens]
+
+
+def _tokens_to_inds(token2ind: Mapping, tokens: List[str]) -> np.ndarray:
+    """
+    Converts link tokens to row indices.
+    :param token2ind: Token to row index mapping of the linked table.
+    :param tokens: List of tokens.
+    :return: <np.int32: n>. The row index of each token, -1 for empty tokens.
+    """
+    if isinstance(token2ind, TokenIndex):
+        return token2ind.get_many(tokens)
+
+    return np.array([token2ind[t] if t != '' else -1 for t in tokens], dtype=np.int32)
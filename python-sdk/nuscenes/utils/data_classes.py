@@ -3,9 +3,9 @@
 # Licensed under the Creative Commons [see licence.txt]
 
 from __future__ import annotations
-from functools import reduce
-import struct
-from typing import Tuple, List, Dict
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, List, Dict, Iterator, Union
 from abc import ABC, abstractmethod
 import os.path as osp
 
@@ -14,7 +14,11 @@ import numpy as np
 from pyquaternion import Quaternion
 from matplotlib.axes import Axes
 
-from nuscenes.utils.geometry_utils import view_points, transform_matrix
+from nuscenes.utils.geometry_utils import view_points
+from nuscenes.utils.sweep_cache import get_sweep_cache
+
+# Number of points that PointCloud.transform() processes at once.
+TRANSFORM_CHUNK_SIZE = 2 ** 16
 
 
 class PointCloud(ABC):
@@ -54,7 +58,7 @@ class PointCloud(ABC):
 
     @classmethod
     def from_file_multisweep(cls, nusc, sample_rec: Dict, chan: str, ref_chan: str, nsweeps: int=26,
-                              min_distance: float=1.0) -> Tuple['PointCloud', np.ndarray]:
+                              min_distance: float=1.0, num_workers: int=4) -> Tuple['PointCloud', np.ndarray]:
         """
         Return a point cloud that aggregates multiple sweeps.
         As every sweep is in a different coordinate frame, we need to map the coordinates to a single reference frame.
@@ -65,65 +69,134 @@ class PointCloud(ABC):
         :param ref_chan: The reference channel of the current sample_rec that the point clouds are mapped to.
         :param nsweeps: Number of sweeps to aggregated.
         :param min_distance: Distance below which points are discarded.
+        :param num_workers: Number of threads that load and transform the sweeps concurrently. 1 loads them one after
+            another.
         :return: (all_pc, all_times). The aggregated point cloud and timestamps.
+        If the sweep cache is enabled (see enable_sweep_cache()), the decoded sweeps are read from and added to it.
         """
 
-        # Init
-        points = np.zeros((cls.nbr_dims(), 0))
-        all_pc = cls(points)
-        all_times = np.zeros((1, 0))
-
-        # Get reference pose and timestamp
+        # Get reference timestamp
         ref_sd_token = sample_rec['data'][ref_chan]
         ref_sd_rec = nusc.get('sample_data', ref_sd_token)
-        ref_pose_rec = nusc.get('ego_pose', ref_sd_rec['ego_pose_token'])
-        ref_cs_rec = nusc.get('calibrated_sensor', ref_sd_rec['calibrated_sensor_token'])
         ref_time = 1e-6 * ref_sd_rec['timestamp']
 
-        # Homogeneous transform from ego car frame to reference frame
-        ref_from_car = transform_matrix(ref_cs_rec['translation'], Quaternion(ref_cs_rec['rotation']), inverse=True)
+        # Look up the current and previous sweeps. All database access happens here, as the database is not
+        # thread-safe.
+        sample_data_token = sample_rec['data'][chan]
+        sweeps = []
+        for current_sd_token in nusc.get_sweeps(sample_data_token, nsweeps):
+            current_sd_rec = nusc.get('sample_data', current_sd_token)
 
-        # Homogeneous transformation matrix from global to _current_ ego car frame
-        car_from_global = transform_matrix(ref_pose_rec['translation'], Quaternion(ref_pose_rec['rotation']),
-                                           inverse=True)
+            # Transform from the current sensor frame to the reference frame, via the past and current ego pose.
+            # The four cached transformation matrices are fused into one.
+            trans_matrix = nusc.sensor_to_sensor(current_sd_token, ref_sd_token)
+            time_lag = ref_time - 1e-6 * current_sd_rec['timestamp']  # positive difference
+            sweeps.append((current_sd_token, osp.join(nusc.dataroot, current_sd_rec['filename']), trans_matrix,
+                           time_lag))
 
-        # Aggregate current and previous sweeps.
-        sample_data_token = sample_rec['data'][chan]
-        current_sd_rec = nusc.get('sample_data', sample_data_token)
-        for _ in range(nsweeps):
-            # Load up the pointcloud.
-            current_pc = cls.from_file(osp.join(nusc.dataroot, current_sd_rec['filename']))
-
-            # Get past pose.
-            current_pose_rec = nusc.get('ego_pose', current_sd_rec['ego_pose_token'])
-            global_from_car = transform_matrix(current_pose_rec['translation'], Quaternion(current_pose_rec['rotation']),
-                                               inverse=False)
-
-            # Homogeneous transformation matrix from sensor coordinate frame to ego car frame.
-            current_cs_rec = nusc.get('calibrated_sensor', current_sd_rec['calibrated_sensor_token'])
-            car_from_current = transform_matrix(current_cs_rec['translation'], Quaternion(current_cs_rec['rotation']),
-                                                inverse=False)
-
-            # Fuse four transformation matrices into one and perform transform.
-            trans_matrix = reduce(np.dot, [ref_from_car, car_from_global, global_from_car, car_from_current])
-            current_pc.transform(trans_matrix)
-
-            # Remove close points and add timevector.
+        def load_sweep(sweep: Tuple[str, str, np.ndarray, float]) -> np.ndarray:
+            # Load up the pointcloud, transform it in place and remove close points.
+            current_pc = cls.from_file_cached(sweep[0], sweep[1])
+            current_pc.transform(sweep[2])
             current_pc.remove_close(min_distance)
-            time_lag = ref_time - 1e-6 * current_sd_rec['timestamp']  # positive difference
-            times = time_lag * np.ones((1, current_pc.nbr_points()))
-            all_times = np.hstack((all_times, times))
+            return current_pc.points
+
+        if num_workers > 1 and len(sweeps) > 1:
+            with ThreadPoolExecutor(max_workers=min(num_workers, len(sweeps))) as executor:
+                sweep_points = list(executor.map(load_sweep, sweeps))
+        else:
+            sweep_points = [load_sweep(sweep) for sweep in sweeps]
+
+        # Merge all sweeps and their timevectors into preallocated buffers, keeping the dtype of the loaded points.
+        # Without sweeps, e.g. for nsweeps=0, an empty point cloud is returned.
+        nbr_points = sum(points.shape[1] for points in sweep_points)
+        dtype = np.result_type(*[points.dtype for points in sweep_points]) if len(sweep_points) > 0 else np.float32
+        all_pc = cls(np.empty((cls.nbr_dims(), nbr_points), dtype=dtype))
+        all_times = np.empty((1, nbr_points))
+        start = 0
+        for points, (_, _, _, time_lag) in zip(sweep_points, sweeps):
+            end = start + points.shape[1]
+            all_pc.points[:, start:end] = points
+            all_times[:, start:end] = time_lag
+            start = end
 
-            # Merge with key pc.
-            all_pc.points = np.hstack((all_pc.points, current_pc.points))
+        return all_pc, all_times
 
-            # Abort if there are no previous sweeps.
-            if current_sd_rec['prev'] == '':
-                break
-            else:
-                current_sd_rec = nusc.get('sample_data', current_sd_rec['prev'])
+    @classmethod
+    def from_file_cached(cls, sample_data_token: str, file_name: str) -> 'PointCloud':
+        """
+        Loads a point cloud from disk, or from the sweep cache if it is enabled (see enable_sweep_cache()).
+        :param sample_data_token: Unique sample_data identifier, used as the cache key.
+        :param file_name: Path of the pointcloud file on disk.
+        :return: PointCloud instance in the sensor frame. Its points are never shared with the cache.
+        """
+        sweep_cache = get_sweep_cache()
+        if sweep_cache is None:
+            return cls.from_file(file_name)
 
-        return all_pc, all_times
+        cached_points = sweep_cache.get((cls.__name__, sample_data_token))
+        if cached_points is not None:
+            return cls(cached_points.copy())
+
+        pc = cls.from_file(file_name)
+        sweep_cache.put((cls.__name__, sample_data_token), np.array(pc.points))
+        return pc
+
+    @classmethod
+    def iter_multisweep(cls, nusc, scene_token: str, chan: str, ref_chan: str, nsweeps: int=26,
+                        min_distance: float=1.0) -> Iterator[Tuple[str, 'PointCloud', np.ndarray]]:
+        """
+        Iterates over the samples of a scene and aggregates multiple sweeps for each, like from_file_multisweep().
+        A sliding window of the sweeps of the current sample is kept in the global frame, so that each sweep is loaded
+        and transformed only once per scene. Each step then maps the whole window to the reference frame of the sample
+        with a single matrix multiplication. The results equal those of from_file_multisweep() up to floating point
+        rounding, as the window is stored in float64. The returned points have the dtype of the loaded points.
+        :param nusc: A NuScenes instance.
+        :param scene_token: Unique identifier of the scene.
+        :param chan: The channel from which we track back n sweeps to aggregate the point cloud.
+        :param ref_chan: The reference channel of each sample that the point clouds are mapped to.
+        :param nsweeps: Number of sweeps to aggregate.
+        :param min_distance: Distance below which points are discarded.
+        :return: Generator of (sample_token, all_pc, all_times) for the samples of the scene in temporal order.
+        """
+        # Maps each sample_data token in the window to its points in the global frame and its timestamp.
+        window = OrderedDict()
+        dtype = None
+
+        for sample_token in nusc.get_scene_samples(scene_token):
+            sample_rec = nusc.get('sample', sample_token)
+            ref_sd_token = sample_rec['data'][ref_chan]
+            ref_time = 1e-6 * nusc.get('sample_data', ref_sd_token)['timestamp']
+
+            # Move the window: keep the sweeps that are still needed and load the new ones, newest first.
+            sweep_tokens = nusc.get_sweeps(sample_rec['data'][chan], nsweeps)
+            new_window = OrderedDict()
+            for sd_token in sweep_tokens:
+                if sd_token in window:
+                    new_window[sd_token] = window[sd_token]
+                    continue
+                sd_rec = nusc.get('sample_data', sd_token)
+                points = cls.from_file_cached(sd_token, osp.join(nusc.dataroot, sd_rec['filename'])).points
+                dtype = points.dtype
+                points = points.astype(np.float64)
+                global_from_sensor = nusc.sensor_to_global(sd_token)
+                points[:3, :] = np.dot(global_from_sensor[:3, :3], points[:3, :]) + global_from_sensor[:3, 3:]
+                new_window[sd_token] = (points, sd_rec['timestamp'])
+            window = new_window
+
+            # Map the whole window to the reference frame at once.
+            points = np.hstack([points for points, _ in window.values()])
+            ref_from_global = nusc.sensor_to_global(ref_sd_token, inverse=True)
+            points[:3, :] = np.dot(ref_from_global[:3, :3], points[:3, :]) + ref_from_global[:3, 3:]
+            times = np.hstack([np.full(points.shape[1], ref_time - 1e-6 * timestamp)
+                               for points, timestamp in window.values()])
+
+            # Remove close points as in remove_close(), also from the timevector.
+            x_filt = np.abs(points[0, :]) < min_distance
+            y_filt = np.abs(points[1, :]) < min_distance
+            not_close = np.logical_not(np.logical_and(x_filt, y_filt))
+
+            yield sample_token, cls(points[:, not_close].astype(dtype)), times[not_close].reshape(1, -1)
 
     def nbr_points(self) -> int:
         """
@@ -140,6 +213,51 @@ class PointCloud(ABC):
         selected_ind = np.random.choice(np.arange(0, self.nbr_points()), size=int(self.nbr_points() * ratio))
         self.points = self.points[:, selected_ind]
 
+    def voxel_downsample(self, voxel_size: Union[float, Tuple[float, float, float]], reduce: str='mean') -> None:
+        """
+        Downsamples the pointcloud to one point per occupied voxel of a regular grid. Unlike subsample() the result is
+        deterministic. The voxels are ordered by their first point in the original pointcloud.
+        :param voxel_size: Edge length of the voxels, or separate edge lengths for x, y, z.
+        :param reduce: How the points of a voxel are combined. 'mean' averages all dimensions, 'first' keeps the first
+            point of each voxel unchanged.
+        """
+        voxel_size = np.broadcast_to(np.asarray(voxel_size, dtype=np.float64), (3,)).reshape(3, 1)
+        if not np.all(voxel_size > 0):
+            raise ValueError('Invalid voxel size: {}'.format(voxel_size.ravel()))
+        if reduce not in ('mean', 'first'):
+            raise ValueError('Invalid reduce mode: {}'.format(reduce))
+        if self.nbr_points() == 0:
+            return
+
+        # Hash the integer voxel coordinates into a single key per point and sort the points by voxel.
+        coords = np.floor(self.points[:3, :] / voxel_size).astype(np.int64)
+        coords -= coords.min(axis=1, keepdims=True)
+        extent = coords.max(axis=1) + 1
+        if np.prod(extent.astype(np.float64)) < 2 ** 62:
+            keys = (coords[0] * extent[1] + coords[1]) * extent[2] + coords[2]
+            perm = np.argsort(keys)
+            keys = keys[perm]
+            new_voxel = keys[1:] != keys[:-1]
+        else:
+            # The keys would overflow, sort by the voxel coordinates instead.
+            perm = np.lexsort(coords[::-1])
+            coords = coords[:, perm]
+            new_voxel = np.any(coords[:, 1:] != coords[:, :-1], axis=0)
+        starts = np.flatnonzero(np.concatenate(([True], new_voxel)))
+
+        # Order the voxels by their first point. The sort above is not stable, so the first point is the minimum index.
+        first = np.minimum.reduceat(perm, starts)
+        order = np.argsort(first)
+        if reduce == 'first':
+            self.points = self.points[:, first[order]]
+            return
+
+        counts = np.diff(np.append(starts, len(perm)))[order]
+        points = np.empty((self.points.shape[0], len(starts)), dtype=self.points.dtype)
+        for d in range(self.points.shape[0]):
+            points[d] = np.add.reduceat(self.points[d, perm], starts, dtype=np.float64)[order] / counts
+        self.points = points
+
     def remove_close(self, radius: float) -> None:
         """
         Removes point too close within a certain radius from origin.
@@ -153,25 +271,48 @@ class PointCloud(ABC):
 
     def translate(self, x: np.ndarray) -> None:
         """
-        Applies a translation to the point cloud.
+        Applies a translation to the point cloud in place. The points keep their dtype.
         :param x: <np.float: 3, 1>. Translation in x, y, z.
         """
-        for i in range(3):
-            self.points[i, :] = self.points[i, :] + x[i]
+        self.points[:3, :] += np.asarray(x, dtype=self.points.dtype).reshape(3, 1)
 
     def rotate(self, rot_matrix: np.ndarray) -> None:
         """
-        Applies a rotation.
+        Applies a rotation in place. The points keep their dtype.
         :param rot_matrix: <np.float: 3, 3>. Rotation matrix.
         """
-        self.points[:3, :] = np.dot(rot_matrix, self.points[:3, :])
+        self._rotate_translate(rot_matrix)
 
     def transform(self, transf_matrix: np.ndarray) -> None:
         """
-        Applies a homogeneous transform.
+        Applies a homogeneous transform in place. The points keep their dtype and are computed as R * p + t, without
+        homogeneous coordinates.
         :param transf_matrix: <np.float: 4, 4>. Homogenous transformation matrix.
         """
-        self.points[:3, :] = transf_matrix.dot(np.vstack((self.points[:3, :], np.ones(self.nbr_points()))))[:3, :]
+        self._rotate_translate(transf_matrix[:3, :3], transf_matrix[:3, 3])
+
+    def _rotate_translate(self, rot_matrix: np.ndarray, translation: np.ndarray=None,
+                          chunk_size: int=TRANSFORM_CHUNK_SIZE) -> None:
+        """
+        Helper function that computes R * p + t in place, in the dtype of the points. The points are processed in
+        chunks, so that only a small buffer is allocated instead of full copies of the point cloud.
+        :param rot_matrix: <np.float: 3, 3>. Rotation matrix.
+        :param translation: <np.float: 3>. Translation in x, y, z or None.
+        :param chunk_size: Number of points per chunk.
+        """
+        xyz = self.points[:3, :]
+        rot_matrix = np.asarray(rot_matrix, dtype=xyz.dtype)
+        if translation is not None:
+            translation = np.asarray(translation, dtype=xyz.dtype).reshape(3, 1)
+
+        buffer = np.empty((3, min(chunk_size, xyz.shape[1])), dtype=xyz.dtype)
+        for start in range(0, xyz.shape[1], chunk_size):
+            chunk = xyz[:, start:start + chunk_size]
+            out = buffer[:, :chunk.shape[1]]
+            np.matmul(rot_matrix, chunk, out=out)
+            if translation is not None:
+                out += translation
+            chunk[...] = out
 
     def render_height(self, ax: Axes, view: np.ndarray=np.eye(4), x_lim: Tuple=(-20, 20), y_lim: Tuple=(-20, 20),
                       marker_size: float=1) -> None:
@@ -216,6 +357,15 @@ class PointCloud(ABC):
 
 class LidarPointCloud(PointCloud):
 
+    def __init__(self, points: np.ndarray):
+        """
+        Initialize a lidar point cloud. By default it has the 4 dimensions x, y, z, intensity. Point clouds loaded with
+        other columns (see from_file()) have between 3 (x, y, z) and 5 (x, y, z, intensity, ring index) dimensions.
+        :param points: <np.float: d, n>. Input point cloud matrix.
+        """
+        assert 3 <= points.shape[0] <= 5, 'Error: Pointcloud points must have format: d x n with 3 <= d <= 5'
+        self.points = points
+
     @staticmethod
     def nbr_dims() -> int:
         """
@@ -225,18 +375,41 @@ class LidarPointCloud(PointCloud):
         return 4
 
     @classmethod
-    def from_file(cls, file_name: str) -> 'LidarPointCloud':
+    def from_file(cls, file_name: str, columns: Tuple[int, ...]=(0, 1, 2, 3), mmap: bool=False,
+                  contiguous: bool=False) -> 'LidarPointCloud':
         """
         Loads LIDAR data from binary numpy format. Data is stored as (x, y, z, intensity, ring index).
         :param file_name: Path of the pointcloud file on disk.
-        :return: LidarPointCloud instance (x, y, z, intensity).
+        :param columns: The columns to load. These must start with x, y, z (0, 1, 2), optionally followed by intensity
+            (3) and ring index (4).
+        :param mmap: Whether to memory-map the file instead of reading it. The points are then a float32 view of the
+            file that is only read from disk when accessed. Modifying the points copies the affected pages and never
+            writes to the file. Consecutive columns are returned without any copy.
+        :param contiguous: Whether to copy the points into a C-contiguous d x n array. Without this, the points are a
+            transposed view of the n x 5 file layout.
+        :return: LidarPointCloud instance (x, y, z, intensity by default).
         """
 
         assert file_name.endswith('.bin'), 'Unsupported filetype {}'.format(file_name)
-
-        scan = np.fromfile(file_name, dtype=np.float32)
-        points = scan.reshape((-1, 5))[:, :cls.nbr_dims()]
-        return cls(points.T)
+        columns = tuple(columns)
+        assert columns[:3] == (0, 1, 2) and len(set(columns)) == len(columns) and set(columns) <= set(range(5)), \
+            'Error: Invalid columns {}!'.format(columns)
+
+        if mmap and osp.getsize(file_name) > 0:
+            scan = np.asarray(np.memmap(file_name, dtype=np.float32, mode='c'))
+        else:
+            scan = np.fromfile(file_name, dtype=np.float32)
+        scan = scan.reshape((-1, 5))
+
+        # A consecutive range of columns can be sliced without copying.
+        if columns == tuple(range(len(columns))):
+            points = scan[:, :len(columns)].T
+        else:
+            points = scan[:, columns].T
+
+        if contiguous:
+            points = np.ascontiguousarray(points)
+        return cls(points)
 
 
 class RadarPointCloud(PointCloud):
@@ -358,45 +531,26 @@ class RadarPointCloud(PointCloud):
         assert height == 1, 'Error: height != 0 not supported!'
         assert data == 'binary'
 
-        # Lookup table for how to decode the binaries.
-        unpacking_lut = {'F': {2: 'e', 4: 'f', 8: 'd'},
-                         'I': {1: 'b', 2: 'h', 4: 'i', 8: 'q'},
-                         'U': {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}}
-        types_str = ''.join([unpacking_lut[t][int(s)] for t, s in zip(types, sizes)])
-
-        # Decode each point.
-        offset = 0
-        point_count = width
-        points = []
-        for i in range(point_count):
-            point = []
-            for p in range(feature_count):
-                start_p = offset
-                end_p = start_p + int(sizes[p])
-                assert end_p < len(data_binary)
-                point_p = struct.unpack(types_str[p], data_binary[start_p:end_p])[0]
-                point.append(point_p)
-                offset = end_p
-            points.append(point)
-
-        # A NaN in the first point indicates an empty pointcloud.
-        point = np.array(points[0])
-        if np.any(np.isnan(point)):
-            return cls(np.zeros((feature_count, 0)))
+        # Describe a point as a structured dtype and decode all points at once.
+        dtype_lut = {'F': 'f', 'I': 'i', 'U': 'u'}
+        dtype = np.dtype([('f{}'.format(p), '<{}{}'.format(dtype_lut[t], s))
+                          for p, (t, s) in enumerate(zip(types, sizes))])
+        assert dtype.itemsize * width <= len(data_binary), 'Error: Truncated PCD body!'
+        records = np.frombuffer(data_binary, dtype=dtype, count=width)
 
         # Convert to numpy matrix.
-        points = np.array(points).transpose()
+        points = np.empty((feature_count, width))
+        for p, name in enumerate(dtype.names):
+            points[p] = records[name]
 
-        # Filter points with an invalid state.
-        valid = [p in invalid_states for p in points[-4, :]]
-        points = points[:, valid]
-
-        # Filter by dynProp.
-        valid = [p in dynprop_states for p in points[3, :]]
-        points = points[:, valid]
+        # A NaN in the first point indicates an empty pointcloud.
+        if np.any(np.isnan(points[:, 0])):
+            return cls(np.zeros((feature_count, 0)))
 
-        # Filter by ambig_state.
-        valid = [p in ambig_states for p in points[11, :]]
+        # Filter points with an invalid state, by dynProp and by ambig_state.
+        valid = np.isin(points[-4, :], list(invalid_states))
+        valid &= np.isin(points[3, :], list(dynprop_states))
+        valid &= np.isin(points[11, :], list(ambig_states))
         points = points[:, valid]
 
         return cls(points)
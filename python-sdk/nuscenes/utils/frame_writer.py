@@ -0,0 +1,49 @@
+# nuScenes dev-kit.
+# Licensed under the Creative Commons [see licence.txt]
+
+import os
+import os.path as osp
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+
+class FrameWriter:
+    """
+    Writes rendered frames to a video file or, if the output path has no file extension, to a directory of numbered
+    JPEG images (000000.jpg, 000001.jpg, ...). It does not need a display.
+    """
+
+    def __init__(self, out_path: str, freq: float, frame_size: Tuple[int, int]):
+        """
+        :param out_path: Path of the video file, e.g. scene-0061.avi, or of the image directory.
+        :param freq: Frame rate of the video (Hz).
+        :param frame_size: (width, height) of the frames.
+        """
+        self.out_path = out_path
+        self.nbr_frames = 0
+
+        if osp.splitext(out_path)[1] == '':
+            os.makedirs(out_path, exist_ok=True)
+            self.video = None
+        else:
+            fourcc = cv2.VideoWriter_fourcc(*'MJPG')
+            self.video = cv2.VideoWriter(out_path, fourcc, freq, tuple(frame_size))
+            assert self.video.isOpened(), 'Error: Cannot open video file %s' % out_path
+
+    def write(self, frame: np.ndarray) -> None:
+        """
+        Writes the next frame.
+        :param frame: <np.uint8: height, width, 3>. BGR image.
+        """
+        if self.video is None:
+            cv2.imwrite(osp.join(self.out_path, '%06d.jpg' % self.nbr_frames), frame)
+        else:
+            self.video.write(frame)
+        self.nbr_frames += 1
+
+    def release(self) -> None:
+        """ Closes the video file. """
+        if self.video is not None:
+            self.video.release()
@@ -139,4 +139,42 @@ def transform_matrix(translation: np.ndarray=np.array([0, 0, 0]), rotation: Quat
         tm[:3, :3] = rotation.rotation_matrix
         tm[:3, 3] = np.transpose(np.array(translation))
 
-    return tm
\ No newline at end of file
+    return tm
+
+
+def quaternions_to_rotation_matrices(quaternions: np.ndarray) -> np.ndarray:
+    """
+    Converts many quaternions to rotation matrices at once. This is a vectorized Quaternion.rotation_matrix.
+    :param quaternions: <np.float: n, 4>. Quaternions (w ri rj rk). They are normalized first.
+    :return: <np.float: n, 3, 3>. Rotation matrices.
+    """
+    q = np.asarray(quaternions, dtype=np.float64).reshape(-1, 4)
+    q = q / np.linalg.norm(q, axis=1, keepdims=True)
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+
+    rotations = np.empty((len(q), 3, 3))
+    rotations[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    rotations[:, 0, 1] = 2 * (x * y - w * z)
+    rotations[:, 0, 2] = 2 * (x * z + w * y)
+    rotations[:, 1, 0] = 2 * (x * y + w * z)
+    rotations[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    rotations[:, 1, 2] = 2 * (y * z - w * x)
+    rotations[:, 2, 0] = 2 * (x * z - w * y)
+    rotations[:, 2, 1] = 2 * (y * z + w * x)
+    rotations[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    return rotations
+
+
+def points_in_box(box, points: np.ndarray, wlh_factor: float=1.0) -> np.ndarray:
+    """
+    Checks whether points are inside a box. Points on the faces of the box count as inside.
+    :param box: The box, in the same frame as the points.
+    :param points: <np.float: 3, n>. Points in x, y, z.
+    :param wlh_factor: Multiply w, l, h by a factor to scale the box.
+    :return: <np.bool: n>. Mask of the points inside the box.
+    """
+    # Express the points in the box frame, where x points forward (length), y to the left (width) and z up (height).
+    local = np.dot(box.rotation_matrix.T, points[:3, :] - np.reshape(box.center, (3, 1)))
+    w, l, h = np.asarray(box.wlh) * wlh_factor
+    half_size = np.array([[l], [w], [h]]) / 2
+    return np.all(np.abs(local) <= half_size, axis=0)
@@ -32,6 +32,17 @@ class MapMask:
         self._binary_mask = None  # Binary mask of semantic prior + dilation of dist_thresh (lazy load)
         self._transf_matrix = None  # Transformation matrix from global coords to map coords (lazy load).
 
+    def __getstate__(self) -> dict:
+        """
+        Pickles the map mask by path. The images are not pickled, they are loaded again on first use.
+        :return: The state to pickle.
+        """
+        state = dict(self.__dict__)
+        state['_mask'] = None
+        state['_distance_mask'] = None
+        state['_binary_mask'] = None
+        return state
+
     @property
     def mask(self) -> np.ndarray:
         """
@@ -0,0 +1,75 @@
+# nuScenes dev-kit.
+# Licensed under the Creative Commons [see licence.txt]
+
+"""
+Packs numpy arrays into a single shared memory block, so that several processes can read them without copies.
+This requires Python 3.8 or later.
+"""
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Tuple
+
+import numpy as np
+
+# Every array starts at a multiple of this many bytes.
+ALIGNMENT = 64
+
+
+def pack_arrays(arrays: Dict[str, np.ndarray]) -> Tuple[shared_memory.SharedMemory, Dict[str, np.ndarray], dict]:
+    """
+    Copies arrays into a new shared memory block.
+    The block stays alive as long as the returned SharedMemory is open. It must be unlinked by the caller when no
+    process needs it anymore.
+    :param arrays: Maps names to numeric, bytes or void arrays. Object arrays are not supported.
+    :return: (shm, views, layout). The shared memory block, read-only views of the arrays in the block and the layout
+        that attach_arrays() needs to find them.
+    """
+    layout = dict()
+    size = 0
+    for name, array in arrays.items():
+        assert array.dtype != object, 'Error: Cannot share object array {}!'.format(name)
+        layout[name] = (size, array.dtype.str, array.shape)
+        size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    views = _views(shm, layout, writeable=True)
+    for name, array in arrays.items():
+        views[name][...] = array
+        views[name].setflags(write=False)
+    return shm, views, {'name': shm.name, 'arrays': layout}
+
+
+def attach_arrays(layout: dict) -> Tuple[shared_memory.SharedMemory, Dict[str, np.ndarray]]:
+    """
+    Attaches to a shared memory block that was created by pack_arrays(), e.g. in a worker process.
+    :param layout: The layout returned by pack_arrays().
+    :return: (shm, views). The shared memory block and read-only views of the arrays in it.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=layout['name'], track=False)
+    except TypeError:
+        # Before Python 3.13 attaching always registers the block with the resource tracker, which unlinks it when
+        # this process exits. Only the creator should unlink it, so registration is skipped.
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            shm = shared_memory.SharedMemory(name=layout['name'])
+        finally:
+            resource_tracker.register = register
+    return shm, _views(shm, layout['arrays'])
+
+
+def _views(shm: shared_memory.SharedMemory, layout: Dict[str, tuple], writeable: bool=False) \
+        -> Dict[str, np.ndarray]:
+    """
+    Creates array views into a shared memory block.
+    :param shm: The shared memory block.
+    :param layout: Maps names to (offset, dtype, shape).
+    :param writeable: Whether the views may be written to.
+    :return: The views by name.
+    """
+    views = dict()
+    for name, (offset, dtype, shape) in layout.items():
+        view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        view.setflags(write=writeable)
+        views[name] = view
+    return views
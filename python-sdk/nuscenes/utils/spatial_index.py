@@ -0,0 +1,217 @@
+# nuScenes dev-kit.
+# Licensed under the Creative Commons [see licence.txt]
+
+"""
+Spatial index for neighbour searches on point clouds, based on hashing the points into a uniform grid.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+from nuscenes.utils.geometry_utils import points_in_box
+
+# Maximum number of (query, cell) pairs that are examined at once. Larger batches of queries are split.
+MAX_QUERY_CELLS = 2 ** 20
+
+
+class PointIndex:
+    """
+    Uniform grid over the points of a point cloud. The points are sorted by grid cell, so that the points of any cell
+    form a contiguous range. All queries are batched and return indices into the original points.
+    Example:
+        index = PointIndex(pc.points, cell_size=0.5)
+        neighbors = index.query_radius(pc.points, radius=0.5)
+    """
+
+    def __init__(self, points: np.ndarray, cell_size: float=1.0):
+        """
+        Builds the index.
+        :param points: <np.float: d, n>. Point cloud matrix. Only x, y, z are used. The array is not copied.
+        :param cell_size: Edge length of the grid cells. Queries are fastest if it is close to the search radius.
+        """
+        if not cell_size > 0:
+            raise ValueError('Invalid cell size: {}'.format(cell_size))
+        self.points = points[:3, :]
+        self.cell_size = float(cell_size)
+
+        if self.nbr_points() > 0:
+            self.origin = self.points.min(axis=1).astype(np.float64)
+            coords = self._cell_coords(self.points)
+            self.extent = coords.max(axis=1) + 1
+        else:
+            self.origin = np.zeros(3)
+            coords = np.zeros((3, 0), dtype=np.int64)
+            self.extent = np.ones(3, dtype=np.int64)
+        assert np.prod(self.extent.astype(np.float64)) < 2 ** 62, 'Error: Cell size too small for these points!'
+
+        # Sort the points by cell key and store the range of every occupied cell.
+        keys = self._cell_keys(coords)
+        self.order = np.argsort(keys, kind='stable')
+        keys = keys[self.order]
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) > 0 else \
+            np.zeros(0, dtype=np.int64)
+        self.cell_keys = keys[starts]
+        self.cell_starts = starts
+        self.cell_ends = np.append(starts[1:], len(keys))
+
+        # A copy of the points in cell order, so that the points of neighboring cells are read from contiguous memory.
+        self.sorted_points = np.ascontiguousarray(self.points[:, self.order], dtype=np.float64)
+
+    def nbr_points(self) -> int:
+        """
+        Returns the number of indexed points.
+        :return: Number of points.
+        """
+        return self.points.shape[1]
+
+    def query_radius(self, queries: np.ndarray, radius: float) -> List[np.ndarray]:
+        """
+        Finds all points within a radius of each query point.
+        :param queries: <np.float: d, m>. Query points. Only x, y, z are used.
+        :param radius: Search radius.
+        :return: For each query the sorted indices of the points within the radius, including the query itself if
+            it is one of the indexed points.
+        """
+        if not radius >= 0:
+            raise ValueError('Invalid radius: {}'.format(radius))
+        queries = np.asarray(queries)[:3, :]
+        if queries.shape[1] == 0:
+            return []
+
+        query_ids, point_ids, _ = self._neighbors(queries, radius)
+        point_ids = self.order[point_ids]
+
+        # Group the matches by query, sorted by point index.
+        point_ids = point_ids[np.argsort(query_ids * self.nbr_points() + point_ids)]
+        bounds = np.searchsorted(query_ids, np.arange(queries.shape[1] + 1))
+        return [point_ids[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def query_knn(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the k nearest points of each query point. The search grows around each query until the k nearest points
+        are certain, so it is fastest if the k nearest points lie within a few cells.
+        :param queries: <np.float: d, m>. Query points. Only x, y, z are used.
+        :param k: Number of neighbors.
+        :return: (dists, inds). <np.float: m, k> distances in ascending order and <np.int: m, k> point indices.
+        """
+        if not 0 < k <= self.nbr_points():
+            raise ValueError('Invalid number of neighbors {} for {} points'.format(k, self.nbr_points()))
+        queries = np.asarray(queries)[:3, :]
+        assert np.all(np.isfinite(queries)), 'Error: Queries must be finite!'
+        nbr_queries = queries.shape[1]
+        all_dists = np.empty((nbr_queries, k))
+        all_inds = np.empty((nbr_queries, k), dtype=np.int64)
+
+        # Search a growing radius around the queries until it contains k points.
+        pending = np.arange(nbr_queries)
+        radius = self.cell_size
+        while len(pending) > 0:
+            query_ids, point_ids, dists = self._neighbors(queries[:, pending], radius)
+
+            # Keep the k nearest points of each query that has enough. As the squared distances are at most radius ** 2,
+            # adding them as a fraction to the query index sorts by query and then by distance in a single pass.
+            order = np.argsort(query_ids + dists / (2 * radius ** 2))
+            point_ids, dists = self.order[point_ids[order]], dists[order]
+            starts = np.searchsorted(query_ids, np.arange(len(pending) + 1))
+            done = np.diff(starts) >= k
+            rows = starts[:-1][done][:, None] + np.arange(k)
+            all_dists[pending[done]] = np.sqrt(dists[rows])
+            all_inds[pending[done]] = point_ids[rows]
+
+            pending = pending[~done]
+            radius *= 2
+
+        return all_dists, all_inds
+
+    def query_boxes(self, boxes: List, wlh_factor: float=1.0) -> List[np.ndarray]:
+        """
+        Finds the points inside each box.
+        :param boxes: Boxes (see data_classes.Box) in the frame of the points.
+        :param wlh_factor: Multiply w, l, h by a factor to scale the boxes.
+        :return: For each box the sorted indices of the points inside it.
+        """
+        result = []
+        for box in boxes:
+            # Gather the points of all cells that overlap the axis aligned bounds of the box.
+            corners = box.corners(wlh_factor)
+            lower = np.maximum(self._cell_coords(corners.min(axis=1, keepdims=True))[:, 0], 0)
+            upper = np.minimum(self._cell_coords(corners.max(axis=1, keepdims=True))[:, 0], self.extent - 1)
+            if np.any(upper < lower):
+                result.append(np.zeros(0, dtype=np.int64))
+                continue
+            grid = np.meshgrid(*[np.arange(lo, up + 1) for lo, up in zip(lower, upper)], indexing='ij')
+            coords = np.vstack([g.ravel() for g in grid])
+            _, point_ids = self._points_in_cells(self._cell_keys(coords))
+
+            inside = points_in_box(box, self.sorted_points[:, point_ids], wlh_factor)
+            result.append(np.sort(self.order[point_ids[inside]]))
+        return result
+
+    def _cell_coords(self, points: np.ndarray) -> np.ndarray:
+        """
+        Computes the integer grid coordinates of points.
+        :param points: <np.float: 3, n>. Points in x, y, z.
+        :return: <np.int64: 3, n>. Cell coordinates, which are outside [0, extent) for points outside the grid.
+        """
+        return np.floor((points - self.origin[:, None]) / self.cell_size).astype(np.int64)
+
+    def _cell_keys(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Hashes cell coordinates inside the grid into unique integer keys.
+        :param coords: <np.int64: 3, n>. Cell coordinates.
+        :return: <np.int64: n>. Cell keys.
+        """
+        return (coords[0] * self.extent[1] + coords[1]) * self.extent[2] + coords[2]
+
+    def _points_in_cells(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Looks up the points of many cells.
+        :param keys: <np.int64: c>. Cell keys.
+        :return: (cell_ids, point_ids). For every point in the cells, the position of its cell in keys and its
+            position in the cell order.
+        """
+        pos = np.minimum(np.searchsorted(self.cell_keys, keys), max(len(self.cell_keys) - 1, 0))
+        occupied = self.cell_keys[pos] == keys if len(self.cell_keys) > 0 else np.zeros(len(keys), dtype=bool)
+        cell_ids = np.flatnonzero(occupied)
+        starts, ends = self.cell_starts[pos[cell_ids]], self.cell_ends[pos[cell_ids]]
+
+        # Expand the ranges of the cells into the sorted positions of their points.
+        counts = ends - starts
+        cell_ids = np.repeat(cell_ids, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return cell_ids, np.repeat(starts, counts) + offsets
+
+    def _neighbors(self, queries: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Finds all pairs of queries and points within a radius. Only the cells that overlap the axis aligned bounds of
+        the sphere around each query are searched.
+        :param queries: <np.float: 3, m>. Query points.
+        :param radius: Search radius.
+        :return: (query_ids, point_ids, dists). Pairs and their squared distances. The query_ids are sorted and the
+            point_ids are positions in the cell order (see self.order).
+        """
+        # Range of cells per query, clipped to the grid.
+        lower = np.maximum(self._cell_coords(queries - radius), 0)
+        upper = np.minimum(self._cell_coords(queries + radius), self.extent[:, None] - 1)
+        span = np.minimum(np.max(upper - lower, axis=1, initial=0), self.extent - 1) + 1
+        offsets = np.stack(np.meshgrid(*[np.arange(n) for n in span], indexing='ij')).reshape(3, 1, -1)
+        batch_size = max(MAX_QUERY_CELLS // offsets.shape[2], 1)
+
+        query_ids, point_ids, dists = [], [], []
+        for start in range(0, queries.shape[1], batch_size):
+            coords = lower[:, start:start + batch_size, None] + offsets
+            valid = np.flatnonzero(np.all(coords <= upper[:, start:start + batch_size, None], axis=0))
+            cell_ids, batch_point_ids = self._points_in_cells(self._cell_keys(coords.reshape(3, -1)[:, valid]))
+            batch_query_ids = start + valid[cell_ids] // offsets.shape[2]
+
+            batch_dists = np.zeros(len(batch_query_ids))
+            for axis in range(3):
+                batch_dists += (self.sorted_points[axis, batch_point_ids] - queries[axis, batch_query_ids]) ** 2
+            within = batch_dists <= radius ** 2
+            query_ids.append(batch_query_ids[within])
+            point_ids.append(batch_point_ids[within])
+            dists.append(batch_dists[within])
+
+        if len(query_ids) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        return np.concatenate(query_ids), np.concatenate(point_ids), np.concatenate(dists)
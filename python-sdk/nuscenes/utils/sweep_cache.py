@@ -0,0 +1,111 @@
+# nuScenes dev-kit.
+# Licensed under the Creative Commons [see licence.txt]
+
+"""
+Process-wide cache of decoded sweeps. Consecutive samples share most of their sweeps, so that loaders that iterate
+over a scene can skip reading and parsing most of the point cloud files in PointCloud.from_file_multisweep().
+"""
+from collections import OrderedDict
+import threading
+from typing import Hashable, Optional
+
+import numpy as np
+
+
+class SweepCache:
+    """
+    Least-recently-used cache of point cloud arrays with a byte budget. It is safe to use from several threads.
+    """
+
+    def __init__(self, max_bytes: int=2 ** 30):
+        """
+        :param max_bytes: Maximum total size of the cached arrays in bytes. The least recently used arrays are evicted
+            when it is exceeded. Arrays larger than this are not cached.
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """
+        Returns a cached array and marks it as most recently used.
+        :param key: The key, e.g. (point cloud class, sample_data token).
+        :return: The read-only array or None if it is not cached.
+        """
+        with self._lock:
+            points = self._items.get(key)
+            if points is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return points
+
+    def put(self, key: Hashable, points: np.ndarray) -> None:
+        """
+        Adds an array to the cache. The array must not be modified afterwards, it is made read-only.
+        :param key: The key, e.g. (point cloud class, sample_data token).
+        :param points: The array to cache.
+        """
+        if points.nbytes > self.max_bytes:
+            return
+        points.setflags(write=False)
+
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key).nbytes
+            self._items[key] = points
+            self.nbytes += points.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """ Removes all arrays and resets the counters. """
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __repr__(self) -> str:
+        return 'SweepCache({} sweeps, {:.1f} of {:.1f} MB, {} hits, {} misses, {} evictions)'.format(
+            len(self), self.nbytes / 2 ** 20, self.max_bytes / 2 ** 20, self.hits, self.misses, self.evictions)
+
+
+# The process-wide cache. None if caching is disabled.
+_sweep_cache = None
+
+
+def enable_sweep_cache(max_bytes: int=2 ** 30) -> SweepCache:
+    """
+    Enables the process-wide sweep cache, replacing any previous cache.
+    :param max_bytes: Maximum total size of the cached sweeps in bytes.
+    :return: The cache, e.g. to inspect its hit and miss counters.
+    """
+    global _sweep_cache
+    _sweep_cache = SweepCache(max_bytes)
+    return _sweep_cache
+
+
+def disable_sweep_cache() -> None:
+    """ Disables the process-wide sweep cache and frees the cached sweeps. """
+    global _sweep_cache
+    _sweep_cache = None
+
+
+def get_sweep_cache() -> Optional[SweepCache]:
+    """
+    Returns the process-wide sweep cache.
+    :return: The cache or None if caching is disabled.
+    """
+    return _sweep_cache
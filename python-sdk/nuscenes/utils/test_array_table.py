@@ -0,0 +1,228 @@
+# nuScenes dev-kit.
+# Licensed under the Creative Commons [see licence.txt]
+
+import pickle
+import unittest
+
+import numpy as np
+
+from nuscenes.utils.array_table import ArrayTable, TokenIndex, encode_tokens, decode_tokens, COMPACT_TOKEN_DTYPE
+
+
+def make_tokens(n: int, seed: int=0) -> list:
+    """ Returns n random 32-character hex tokens. """
+    rng = np.random.RandomState(seed)
+    return [bytes(rng.randint(0, 256, 16).astype(np.uint8)).hex() for _ in range(n)]
+
+
+def make_tables(tokens: list, target_tokens: list) -> tuple:
+    """
+    Returns the records of a target table and of a table that links to it and to itself.
+    :param tokens: Tokens of the linking table.
+    :param target_tokens: Tokens of the target table.
+    :return: (records, target_records).
+    """
+    target_records = [{'token': t, 'name': 'target-%d' % i} for i, t in enumerate(target_tokens)]
+    records = []
+    for i, token in enumerate(tokens):
+        records.append({
+            'token': token,
+            'target_token': target_tokens[i % len(target_tokens)],
+            'attribute_tokens': target_tokens[:i % 3],
+            'prev': tokens[i - 1] if i > 0 else '',
+            'next': tokens[i + 1] if i + 1 < len(tokens) else '',
+            'timestamp': 1000 + i,
+            'is_key_frame': i % 2 == 0,
+            'score': 0.5 * i,
+            'translation': [float(i), 2.0, -1.5],
+            'name': 'record-%d' % (i % 4),
+            'mixed': [i] * (i % 3)
+        })
+    return records, target_records
+
+
+LINKS = {'target_token': 'target', 'attribute_tokens': 'target', 'prev': 'source', 'next': 'source'}
+
+
+def make_array_table(records: list, target_records: list, compact_tokens: bool) -> ArrayTable:
+    """ Converts the linking table to an ArrayTable, like NuScenes does with table_backend='array'. """
+    tokens = {'target': encode_tokens([r['token'] for r in target_records], compact=compact_tokens)}
+    if tokens['target'].dtype == COMPACT_TOKEN_DTYPE:
+        token2ind = {'target': TokenIndex(tokens['target'])}
+    else:
+        token2ind = {'target': {r['token']: i for i, r in enumerate(target_records)}}
+    token2ind['source'] = {r['token']: i for i, r in enumerate(records)}
+
+    table = ArrayTable(records, LINKS, token2ind, tokens, compact_tokens=compact_tokens)
+    tokens['source'] = table.columns['token']
+    return table
+
+
+class TestArrayTable(unittest.TestCase):
+    def test_round_trip(self):
+        """Test that every record of an ArrayTable equals the record it was created from."""
+        records, target_records = make_tables(make_tokens(20), make_tokens(5, seed=1))
+        for compact_tokens in [False, True]:
+            table = make_array_table(records, target_records, compact_tokens)
+            self.assertEqual(len(table), len(records))
+            self.assertEqual([dict(record) for record in table], records)
+            self.assertEqual(table[-1], records[-1])
+            self.assertEqual(table[2:5], records[2:5])
+            self.assertEqual(pickle.loads(pickle.dumps(table[3])), records[3])
+
+            # Value types match the JSON table.
+            record = table[1]
+            self.assertIs(type(record['timestamp']), int)
+            self.assertIs(type(record['is_key_frame']), bool)
+            self.assertIs(type(record['score']), float)
+            self.assertIs(type(record['translation']), list)
+
+    def test_columns(self):
+        """Test the column kinds and the vectorized access to link and link list columns."""
+        records, target_records = make_tables(make_tokens(20), make_tokens(5, seed=1))
+        table = make_array_table(records, target_records, compact_tokens=True)
+
+        self.assertEqual(table.kinds['token'], 'token')
+        self.assertEqual(table.kinds['target_token'], 'link')
+        self.assertEqual(table.kinds['attribute_tokens'], 'link_list')
+        self.assertEqual(table.kinds['name'], 'string')
+        self.assertEqual(table.kinds['translation'], 'vector')
+        self.assertEqual(table.kinds['mixed'], 'object')
+
+        # Links are stored as row indices, with -1 for empty links.
+        self.assertEqual(table.column('target_token').tolist(), [i % 5 for i in range(20)])
+        self.assertEqual(table.column('prev').tolist(), list(range(-1, 19)))
+        self.assertEqual(table.column('next').tolist(), list(range(1, 20)) + [-1])
+
+        # Lists of links are stored flat, with offsets.
+        offsets = table.column_offsets('attribute_tokens')
+        inds = table.column('attribute_tokens')
+        for i, record in enumerate(records):
+            self.assertEqual(inds[offsets[i]:offsets[i + 1]].tolist(), list(range(len(record['attribute_tokens']))))
+
+        self.assertEqual(table.column('token').tolist(), [r['token'] for r in records])
+        self.assertEqual(table.column('name').tolist(), [r['name'] for r in records])
+
+    def test_from_columns(self):
+        """Test that a table created from the columns of another table has the same records."""
+        records, target_records = make_tables(make_tokens(10), make_tokens(3, seed=1))
+        table = make_array_table(records, target_records, compact_tokens=True)
+        copy = ArrayTable.from_columns(table.columns, table.kinds, table.links, table.tokens, len(table))
+        self.assertEqual([dict(record) for record in copy], records)
+
+    def test_set_column(self):
+        """Test adding a column and the read-only records."""
+        records, target_records = make_tables(make_tokens(10), make_tokens(3, seed=1))
+        table = make_array_table(records, target_records, compact_tokens=False)
+
+        table.set_column('category_name', np.array(['car', 'bus'] * 5, dtype=object))
+        self.assertEqual(table.kinds['category_name'], 'string')
+        self.assertEqual(table[3]['category_name'], 'bus')
+        self.assertIn('category_name', table[3])
+
+        with self.assertRaises(AssertionError):
+            table.set_column('short', [1, 2])
+
+        # Records are views that are created on every access, so writes are refused rather than lost.
+        record = table[0]
+        with self.assertRaises(TypeError):
+            record['timestamp'] = 5
+        with self.assertRaises(TypeError):
+            del record['timestamp']
+        self.assertEqual(table[0]['timestamp'], 1000)
+
+    def test_empty(self):
+        """Test tables without records."""
+        table = ArrayTable([], {}, {}, {})
+        self.assertEqual(len(table), 0)
+        self.assertEqual(list(table), [])
+        self.assertEqual(table.fields(), [])
+        with self.assertRaises(IndexError):
+            table[0]
+
+        index = TokenIndex(encode_tokens([], compact=True))
+        self.assertEqual(len(index), 0)
+        self.assertNotIn(make_tokens(1)[0], index)
+        self.assertEqual(index.get_many(['']).tolist(), [-1])
+        with self.assertRaises(KeyError):
+            index.get_many(make_tokens(1))
+
+    def test_missing(self):
+        """Test that missing fields, rows and links raise the same errors as a list of dicts."""
+        records, target_records = make_tables(make_tokens(10), make_tokens(3, seed=1))
+        table = make_array_table(records, target_records, compact_tokens=True)
+
+        with self.assertRaises(KeyError):
+            table[0]['missing']
+        self.assertIsNone(table[0].get('missing'))
+        with self.assertRaises(IndexError):
+            table[10]
+
+        # Links to tokens that are not in the linked table.
+        records[4]['target_token'] = make_tokens(1, seed=2)[0]
+        with self.assertRaises(KeyError):
+            make_array_table(records, target_records, compact_tokens=True)
+        with self.assertRaises(KeyError):
+            make_array_table(records, target_records, compact_tokens=False)
+
+
+class TestTokens(unittest.TestCase):
+    def test_encode_decode(self):
+        """Test that tokens are restored by decode_tokens()."""
+        tokens = make_tokens(50)
+        encoded = encode_tokens(tokens, compact=True)
+        self.assertEqual(encoded.dtype, COMPACT_TOKEN_DTYPE)
+        self.assertEqual(decode_tokens(encoded), tokens)
+
+        encoded = encode_tokens(tokens)
+        self.assertNotEqual(encoded.dtype, COMPACT_TOKEN_DTYPE)
+        self.assertEqual(decode_tokens(encoded), tokens)
+
+        # Tokens ending in null bytes.
+        tokens = ['0' * 32, 'ab' + '0' * 30]
+        self.assertEqual(decode_tokens(encode_tokens(tokens, compact=True)), tokens)
+
+    def test_non_hex(self):
+        """Test that tokens that are not lower-case 32-character hex strings are stored as they are."""
+        for tokens in [['not-a-token'], ['g' * 32, '0' * 32], ['AB' * 16], make_tokens(3) + ['']]:
+            encoded = encode_tokens(tokens, compact=True)
+            self.assertNotEqual(encoded.dtype, COMPACT_TOKEN_DTYPE)
+            self.assertEqual(decode_tokens(encoded), tokens)
+
+        # Tables with such tokens fall back to the string encoding and a dict index.
+        target_tokens = ['target-%d' % i for i in range(3)]
+        records, target_records = make_tables(['source-%d' % i for i in range(6)], target_tokens)
+        table = make_array_table(records, target_records, compact_tokens=True)
+        self.assertNotEqual(table.columns['token'].dtype, COMPACT_TOKEN_DTYPE)
+        self.assertEqual([dict(record) for record in table], records)
+
+
+class TestTokenIndex(unittest.TestCase):
+    def test_lookup(self):
+        """Test that TokenIndex maps tokens to row indices like a dict."""
+        tokens = make_tokens(100) + ['0' * 32, 'ab' + '0' * 30]
+        index = TokenIndex(encode_tokens(tokens, compact=True))
+        self.assertEqual(len(index), len(tokens))
+        self.assertEqual(dict(index), {t: i for i, t in enumerate(tokens)})
+        for ind, token in enumerate(tokens):
+            self.assertEqual(index[token], ind)
+            self.assertIn(token, index)
+        self.assertEqual(index.get_many(tokens[::-1] + ['']).tolist(), list(range(len(tokens)))[::-1] + [-1])
+
+        copy = TokenIndex.from_arrays(index.sorted_keys, index.order)
+        self.assertEqual(dict(copy), dict(index))
+        self.assertEqual(dict(pickle.loads(pickle.dumps(index))), dict(index))
+
+    def test_missing(self):
+        """Test that unknown and invalid tokens raise a KeyError."""
+        tokens = make_tokens(10)
+        index = TokenIndex(encode_tokens(tokens, compact=True))
+        for token in make_tokens(3, seed=1) + ['', 'not-a-token', 'ab', 'g' * 32, tokens[0].upper(), 5, None]:
+            with self.assertRaises(KeyError):
+                index[token]
+            self.assertIsNone(index.get(token))
+        with self.assertRaises(KeyError):
+            index.get_many(make_tokens(1, seed=1))
+        with self.assertRaises(KeyError):
+            index.get_many(['not-a-token'])
+
@@ -0,0 +1,27 @@
+# nuScenes dev-kit.
+# Licensed under the Creative Commons [see licence.txt]
+
+import tempfile
+import unittest
+
+import numpy as np
+
+from nuscenes.nuscenes import NuScenes
+from nuscenes.utils.data_classes import LidarPointCloud, RadarPointCloud
+from nuscenes.utils.testing import write_test_db
+
+
+class TestMultisweep(unittest.TestCase):
+    def test_no_sweeps(self):
+        """Test that aggregating no sweeps returns an empty point cloud."""
+        with tempfile.TemporaryDirectory() as dataroot:
+            write_test_db(dataroot)
+            nusc = NuScenes(dataroot=dataroot, verbose=False)
+            for pc_class in [LidarPointCloud, RadarPointCloud]:
+                for num_workers in [1, 4]:
+                    pc, times = pc_class.from_file_multisweep(nusc, nusc.sample[0], 'LIDAR_TOP', 'LIDAR_TOP', nsweeps=0,
+                                                              num_workers=num_workers)
+                    self.assertIsInstance(pc, pc_class)
+                    self.assertEqual(pc.points.shape, (pc_class.nbr_dims(), 0))
+                    self.assertEqual(pc.points.dtype, np.float32)
+                    self.assertEqual(times.shape, (1, 0))
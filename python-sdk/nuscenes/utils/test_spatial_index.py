@@ -0,0 +1,107 @@
+# nuScenes dev-kit.
+# Licensed under the Creative Commons [see licence.txt]
+
+import unittest
+
+import numpy as np
+from pyquaternion import Quaternion
+
+from nuscenes.utils.data_classes import Box
+from nuscenes.utils.geometry_utils import points_in_box
+from nuscenes.utils.spatial_index import PointIndex
+
+
+def brute_force_dists(points: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """ Returns the <np.float: m, n> distances between every query and every point. """
+    diff = queries[:3, :, None].astype(np.float64) - points[:3, None, :].astype(np.float64)
+    return np.sqrt(np.sum(diff ** 2, axis=0))
+
+
+class TestPointIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.points = (rng.rand(4, 1000) * [[20], [20], [4], [1]]).astype(np.float32)
+
+        # Queries on indexed points, inside the grid and far outside of it.
+        self.queries = np.hstack([self.points[:3, :30].astype(np.float64),
+                                  rng.rand(3, 20) * [[20], [20], [4]],
+                                  rng.rand(3, 10) * 100 - 50,
+                                  [[1e3], [-1e3], [0]]])
+
+    def test_query_radius(self):
+        """Compare query_radius() with a brute force search."""
+        dists = brute_force_dists(self.points, self.queries)
+        for cell_size in [0.3, 1.0, 7.0]:
+            index = PointIndex(self.points, cell_size)
+            for radius in [0.0, 0.45, 2.1]:
+                result = index.query_radius(self.queries, radius)
+                self.assertEqual(len(result), self.queries.shape[1])
+                for inds, row in zip(result, dists):
+                    np.testing.assert_array_equal(inds, np.flatnonzero(row <= radius))
+
+        # Every indexed point finds itself.
+        result = PointIndex(self.points, 1.0).query_radius(self.points, 0.0)
+        self.assertTrue(all(i in inds for i, inds in enumerate(result)))
+
+    def test_query_knn(self):
+        """Compare query_knn() with a brute force search."""
+        dists = brute_force_dists(self.points, self.queries)
+        ref_dists = np.sort(dists, axis=1)
+        for cell_size in [0.3, 1.0, 7.0]:
+            index = PointIndex(self.points, cell_size)
+            for k in [1, 4, 50, index.nbr_points()]:
+                knn_dists, knn_inds = index.query_knn(self.queries, k)
+                self.assertEqual(knn_dists.shape, (self.queries.shape[1], k))
+                np.testing.assert_allclose(knn_dists, ref_dists[:, :k])
+                np.testing.assert_allclose(np.take_along_axis(dists, knn_inds, axis=1), knn_dists)
+
+            # With k equal to the number of points, every point is returned once.
+            _, knn_inds = index.query_knn(self.queries, index.nbr_points())
+            np.testing.assert_array_equal(np.sort(knn_inds, axis=1),
+                                          np.tile(np.arange(index.nbr_points()), (self.queries.shape[1], 1)))
+
+    def test_query_boxes(self):
+        """Compare query_boxes() with points_in_box() on all points."""
+        boxes = [Box([5, 5, 1], [2, 4, 1.5], Quaternion(axis=[0, 0, 1], angle=0.6)),
+                 Box([10, 12, 2], [6, 3, 8], Quaternion(axis=[1, 1, 1], angle=1.2)),
+                 Box([0, 0, 0], [5, 5, 5], Quaternion()),
+                 Box([100, 0, 0], [1, 1, 1], Quaternion())]
+        for cell_size in [0.3, 1.0, 7.0]:
+            index = PointIndex(self.points, cell_size)
+            for wlh_factor in [1.0, 1.5]:
+                result = index.query_boxes(boxes, wlh_factor)
+                self.assertEqual(len(result), len(boxes))
+                for inds, box in zip(result, boxes):
+                    np.testing.assert_array_equal(inds, np.flatnonzero(points_in_box(box, self.points, wlh_factor)))
+        self.assertEqual(len(result[-1]), 0)
+
+    def test_empty(self):
+        """Test empty queries and an empty index."""
+        index = PointIndex(self.points, 1.0)
+        self.assertEqual(index.query_radius(np.zeros((3, 0)), 1.0), [])
+        knn_dists, knn_inds = index.query_knn(np.zeros((3, 0)), 3)
+        self.assertEqual(knn_dists.shape, (0, 3))
+        self.assertEqual(knn_inds.shape, (0, 3))
+        self.assertEqual(index.query_boxes([]), [])
+
+        index = PointIndex(np.zeros((4, 0), dtype=np.float32), 1.0)
+        self.assertEqual(index.nbr_points(), 0)
+        result = index.query_radius(self.queries, 5.0)
+        self.assertEqual(len(result), self.queries.shape[1])
+        self.assertTrue(all(len(inds) == 0 for inds in result))
+        result = index.query_boxes([Box([0, 0, 0], [5, 5, 5], Quaternion())])
+        self.assertEqual(len(result[0]), 0)
+        with self.assertRaises(ValueError):
+            index.query_knn(self.queries, 1)
+
+    def test_invalid(self):
+        """Test invalid arguments."""
+        with self.assertRaises(ValueError):
+            PointIndex(self.points, 0)
+        index = PointIndex(self.points, 1.0)
+        with self.assertRaises(ValueError):
+            index.query_radius(self.queries, -1.0)
+        with self.assertRaises(ValueError):
+            index.query_knn(self.queries, 0)
+        with self.assertRaises(ValueError):
+            index.query_knn(self.queries, index.nbr_points() + 1)
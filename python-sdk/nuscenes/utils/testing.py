@@ -0,0 +1,150 @@
+# nuScenes dev-kit.
+# Licensed under the Creative Commons [see licence.txt]
+
+"""
+Writes a small synthetic database for the unit tests. It only contains the JSON tables and the map images, no sensor
+data.
+"""
+import json
+import os
+import os.path as osp
+
+import cv2
+import numpy as np
+from pyquaternion import Quaternion
+
+# Logs of the teaser val split, see create_splits_logs().
+TEST_LOGFILES = ['n015-2018-07-18-11-07-57+0800', 'n008-2018-08-01-15-16-36-0400']
+
+# Attributes used by the detection evaluation.
+TEST_ATTRIBUTES = ['cycle.with_rider', 'cycle.without_rider', 'pedestrian.moving', 'pedestrian.sitting_lying_down',
+                   'pedestrian.standing', 'vehicle.moving', 'vehicle.parked', 'vehicle.stopped']
+
+
+def write_test_db(dataroot: str, version: str='v0.1', nbr_scenes_per_log: int=2, nbr_samples: int=3,
+                  nbr_instances: int=3) -> None:
+    """
+    Writes a synthetic database to dataroot. Each log has a LIDAR_TOP and a CAM_FRONT sensor, whose sample_data
+    (one sweep between every two samples) are linked by prev/next across all scenes of the log, as in nuScenes.
+    :param dataroot: Folder to write the database to.
+    :param version: Version folder of the tables.
+    :param nbr_scenes_per_log: Number of scenes of each log.
+    :param nbr_samples: Number of samples of each scene.
+    :param nbr_instances: Number of annotated instances of each scene, each annotated in every sample.
+    """
+    rng = np.random.RandomState(0)
+
+    def token() -> str:
+        return bytes(rng.randint(0, 256, 16).astype(np.uint8)).hex()
+
+    def rotation() -> list:
+        return Quaternion(axis=[0, 0, 1], angle=rng.rand() * 2 * np.pi).elements.tolist()
+
+    tables = {name: [] for name in ['category', 'attribute', 'visibility', 'instance', 'sensor', 'calibrated_sensor',
+                                    'ego_pose', 'log', 'scene', 'sample', 'sample_data', 'sample_annotation', 'map']}
+    for name in ['vehicle.car', 'human.pedestrian.adult', 'movable_object.barrier']:
+        tables['category'].append({'token': token(), 'name': name, 'description': ''})
+    for name in TEST_ATTRIBUTES:
+        tables['attribute'].append({'token': token(), 'name': name, 'description': ''})
+    attribute_tokens = {attribute['name']: attribute['token'] for attribute in tables['attribute']}
+    category_attributes = [[attribute_tokens['vehicle.parked']], [attribute_tokens['pedestrian.standing']], []]
+    for level in range(1, 5):
+        tables['visibility'].append({'token': str(level), 'level': 'v%d' % level, 'description': ''})
+    sensors = {'LIDAR_TOP': 'lidar', 'CAM_FRONT': 'camera'}
+    sensor_tokens = dict()
+    for channel, modality in sensors.items():
+        sensor_tokens[channel] = token()
+        tables['sensor'].append({'token': sensor_tokens[channel], 'channel': channel, 'modality': modality})
+
+    os.makedirs(osp.join(dataroot, version), exist_ok=True)
+    os.makedirs(osp.join(dataroot, 'maps'), exist_ok=True)
+    timestamp = 1532402927000000
+    for log_ind, logfile in enumerate(TEST_LOGFILES):
+        log = {'token': token(), 'logfile': logfile, 'vehicle': 'n015', 'date_captured': '2018-07-18',
+               'location': 'singapore'}
+        tables['log'].append(log)
+        filename = 'maps/map%d.png' % log_ind
+        cv2.imwrite(osp.join(dataroot, filename), np.zeros((20, 30), dtype=np.uint8))
+        tables['map'].append({'token': token(), 'log_token': log['token'], 'category': 'semantic_prior',
+                              'filename': filename})
+
+        cs_tokens = dict()
+        for channel, modality in sensors.items():
+            cs_tokens[channel] = token()
+            tables['calibrated_sensor'].append({
+                'token': cs_tokens[channel], 'sensor_token': sensor_tokens[channel],
+                'translation': [1.0, 0.0, 1.5], 'rotation': [1.0, 0.0, 0.0, 0.0],
+                'camera_intrinsic': [[200.0, 0.0, 80.0], [0.0, 200.0, 45.0], [0.0, 0.0, 1.0]]
+                if modality == 'camera' else []})
+
+        chains = {channel: [] for channel in sensors}
+        for _ in range(nbr_scenes_per_log):
+            scene = {'token': token(), 'name': 'scene-%04d' % len(tables['scene']), 'description': '',
+                     'log_token': log['token'], 'nbr_samples': nbr_samples}
+            tables['scene'].append(scene)
+            samples = [{'token': token(), 'timestamp': timestamp + i * 500000, 'scene_token': scene['token'],
+                        'prev': '', 'next': ''} for i in range(nbr_samples)]
+            _link(samples)
+            tables['sample'].extend(samples)
+            scene['first_sample_token'] = samples[0]['token']
+            scene['last_sample_token'] = samples[-1]['token']
+
+            for channel in sensors:
+                for sample in samples:
+                    # A sweep before every key frame, which belongs to the same sample as in nuScenes.
+                    for offset, is_key_frame in [(-250000, False), (0, True)]:
+                        pose = {'token': token(), 'timestamp': sample['timestamp'] + offset,
+                                'translation': (rng.randn(3) + [100, 100, 0]).tolist(), 'rotation': rotation()}
+                        tables['ego_pose'].append(pose)
+                        is_camera = sensors[channel] == 'camera'
+                        chains[channel].append({
+                            'token': token(), 'sample_token': sample['token'], 'ego_pose_token': pose['token'],
+                            'calibrated_sensor_token': cs_tokens[channel], 'timestamp': pose['timestamp'],
+                            'fileformat': 'jpg' if is_camera else 'pcd', 'is_key_frame': is_key_frame,
+                            'height': 90 if is_camera else 0, 'width': 160 if is_camera else 0,
+                            'filename': 'samples/%s/%s.%s' % (channel, token(), 'jpg' if is_camera else 'pcd.bin'),
+                            'prev': '', 'next': ''})
+
+            for instance_ind in range(nbr_instances):
+                category_ind = instance_ind % len(tables['category'])
+                category = tables['category'][category_ind]
+                instance = {'token': token(), 'category_token': category['token'], 'nbr_annotations': nbr_samples}
+                tables['instance'].append(instance)
+                center = rng.randn(3) * 10 + [100, 100, 0]
+                annotations = []
+                for sample in samples:
+                    center = center + rng.randn(3) * 0.5
+                    annotations.append({
+                        'token': token(), 'sample_token': sample['token'], 'instance_token': instance['token'],
+                        'attribute_tokens': category_attributes[category_ind],
+                        'visibility_token': '4', 'translation': center.tolist(), 'size': (rng.rand(3) + 1).tolist(),
+                        'rotation': rotation(), 'num_lidar_pts': 10, 'num_radar_pts': 0, 'prev': '', 'next': ''})
+                _link(annotations)
+                tables['sample_annotation'].extend(annotations)
+                instance['first_annotation_token'] = annotations[0]['token']
+                instance['last_annotation_token'] = annotations[-1]['token']
+
+            timestamp += 20 * 1000000
+
+        # The sample_data of each sensor form a single chain across the scenes of the log.
+        for chain in chains.values():
+            _link(chain)
+            tables['sample_data'].extend(chain)
+
+    # Shuffle the large tables, so that the row order differs from the chain order.
+    for name in ['ego_pose', 'sample_data', 'sample_annotation']:
+        tables[name] = [tables[name][i] for i in rng.permutation(len(tables[name]))]
+
+    for name, table in tables.items():
+        with open(osp.join(dataroot, version, name + '.json'), 'w') as f:
+            json.dump(table, f)
+
+
+def _link(records: list) -> None:
+    """
+    Sets the prev and next fields of records that form a chain.
+    :param records: The records in chain order.
+    """
+    for prev_record, next_record in zip(records[:-1], records[1:]):
+        prev_record['next'] = next_record['token']
+        next_record['prev'] = prev_record['token']
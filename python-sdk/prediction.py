@@ -1,5 +1,6 @@
 # Let's start by initializing the database
 from nuscenes.nuscenes import NuScenes
+from nuscenes.utils.data_classes import LidarPointCloud
 import numpy as np
 import matplotlib.pyplot as plt
 import pcl
@@ -50,9 +51,9 @@ for sample_id in sample_token_list:
     #   vg.setLeafSize (0.01f, 0.01f, 0.01f);
     #   vg.filter (*cloud_filtered);
     #   std::cout << "PointCloud after filtering has: " << cloud_filtered->points.size ()  << " data points." << std::endl; //*
-    vg = cloud.make_voxel_grid_filter()
-    vg.set_leaf_size (0.01, 0.01, 0.01)
-    cloud_filtered = vg.filter ()
+    voxel_pc = LidarPointCloud(points.copy())
+    voxel_pc.voxel_downsample(0.01)
+    cloud_filtered = pcl.PointCloud(np.ascontiguousarray(voxel_pc.points.T))
 
     #   // Create the segmentation object for the planar model and set all the parameters
     #   pcl::SACSegmentation<pcl::PointXYZ> seg;